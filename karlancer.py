@@ -8,17 +8,28 @@
 import os
 import sys
 import json
+import hashlib
+import html
+import sqlite3
 import re
+import shutil
+import heapq
+import random
+import math
 import time
 import subprocess
 import argparse
+import threading
 import requests
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
-load_dotenv()
-
 if sys.stdout.encoding != 'utf-8':
     sys.stdout.reconfigure(encoding='utf-8')
 if sys.stderr.encoding != 'utf-8':
@@ -28,19 +39,178 @@ os.environ['PYTHONIOENCODING'] = 'utf-8'
 os.environ['LANG'] = 'C.UTF-8'
 os.environ['LC_ALL'] = 'C.UTF-8'
 
-# socks:// -> socks5h:// برای سازگاری requests با PySocks
-for key in ('all_proxy', 'ALL_PROXY'):
-    val = os.environ.get(key, '')
-    if val.startswith('socks://'):
-        os.environ[key] = val.replace('socks://', 'socks5h://', 1)
+
+def load_env():
+    load_dotenv()
+    # socks:// -> socks5h:// برای سازگاری requests با PySocks
+    for key in ('all_proxy', 'ALL_PROXY'):
+        val = os.environ.get(key, '')
+        if val.startswith('socks://'):
+            os.environ[key] = val.replace('socks://', 'socks5h://', 1)
+
+
+# ---------------------------------------------------------------------------
+# Startup profile (زمان هر مرحله‌ی شروع، با --startup-profile)
+# ---------------------------------------------------------------------------
+
+class StartupProfile:
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.enabled = False
+        self.phases = []
+        self._waiting = set()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start)
+
+    def record(self, name: str, start: float):
+        with self._lock:
+            self.phases.append((name, start - self.t0, time.perf_counter() - start))
+
+    def require(self, *keys):
+        with self._lock:
+            self._waiting.update(keys)
+
+    def done(self, key: str, name: str = None):
+        # گزارش وقتی چاپ میشه که همه‌ی مراحل مورد انتظار (از جمله بررسی‌های پس‌زمینه) تموم شده باشن
+        if name:
+            self.record(name, time.perf_counter())
+        with self._lock:
+            self._waiting.discard(key)
+            ready = not self._waiting
+        if ready:
+            self.report()
+
+    def report(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            phases = sorted(self.phases, key=lambda p: p[1])
+        print("⏱️  پروفایل شروع:", flush=True)
+        for name, offset, duration in phases:
+            print(f"   {offset:8.3f}s  {duration:8.3f}s  {name}", flush=True)
+
+
+STARTUP = StartupProfile()
 
 
 # ---------------------------------------------------------------------------
-# Claude CLI helper (rate-limit aware)
+# Claude scheduler (token bucket + سقف همزمانی + backoff مشترک)
 # ---------------------------------------------------------------------------
 
+class ClaudeScheduler:
+
+    RATE_LIMIT_MARKERS = ('rate limit', '429', 'too many', 'overloaded')
+    DEFAULT_WAIT = 60
+
+    def __init__(self, rate_per_min: float = 10, burst: int = 3, concurrency: int = 3):
+        self._lock = threading.Lock()
+        self._blocked_until = 0.0
+        self.waits = deque(maxlen=500)
+        self.calls = 0
+        self.rate_limited = 0
+        self.configure(rate_per_min, burst, concurrency)
+
+    def configure(self, rate_per_min: float, burst: int, concurrency: int):
+        with self._lock:
+            self.rate = max(rate_per_min, 0.1) / 60.0
+            self.burst = max(1, burst)
+            self.concurrency = max(1, concurrency)
+            self._tokens = float(self.burst)
+            self._refilled = time.monotonic()
+            self._slots = threading.BoundedSemaphore(self.concurrency)
+
+    def _try_take(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            blocked = self._blocked_until - now
+            if blocked > 0:
+                return blocked
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+            self._refilled = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self) -> threading.BoundedSemaphore:
+        start = time.monotonic()
+        slots = self._slots
+        slots.acquire()
+        while True:
+            wait = self._try_take()
+            if wait <= 0:
+                break
+            time.sleep(min(wait, 5))
+        self._record(start)
+        return slots
+
+    def _record(self, start: float):
+        with self._lock:
+            self.calls += 1
+            self.waits.append(time.monotonic() - start)
+
+    def block_for(self, seconds: float):
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self.rate_limited += 1
+
+    def is_rate_limited(self, result: subprocess.CompletedProcess) -> bool:
+        if result.returncode == 0:
+            return False
+        err = (result.stderr or '').lower()
+        return any(m in err for m in self.RATE_LIMIT_MARKERS)
+
+    def retry_after(self, text: str) -> int:
+        m = re.search(r'(\d+)\s*(?:second|ثانیه|sec)', text)
+        if m:
+            return int(m.group(1)) + 5
+        m = re.search(r'(\d+)\s*(?:minute|دقیقه|min)', text)
+        if m:
+            return int(m.group(1)) * 60 + 5
+        return self.DEFAULT_WAIT
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self.waits)
+            calls, limited = self.calls, self.rate_limited
+        if not waits:
+            return {"calls": calls, "rate_limited": limited, "wait_avg": 0.0, "wait_p90": 0.0, "wait_max": 0.0}
+        return {
+            "calls": calls,
+            "rate_limited": limited,
+            "wait_avg": sum(waits) / len(waits),
+            "wait_p90": waits[min(len(waits) - 1, int(len(waits) * 0.9))],
+            "wait_max": waits[-1],
+        }
+
+
+CLAUDE = ClaudeScheduler()
+
+
+def _claude_backoff(result: subprocess.CompletedProcess, log_fn=None) -> bool:
+    if not CLAUDE.is_rate_limited(result):
+        return False
+    # همه فراخوانی‌ها (تحلیل و چت) تا پایان این زمان صبر می‌کنن
+    wait = CLAUDE.retry_after(result.stderr)
+    CLAUDE.block_for(wait)
+    ts = datetime.now().strftime('%H:%M:%S')
+    print(f"[{ts}] ⏳ Claude rate limit — توقف همه فراخوانی‌ها برای {wait} ثانیه...", flush=True)
+    if log_fn:
+        log_fn(f"Claude rate limit — خواب {wait} ثانیه")
+    return True
+
+
 def run_claude(model: str, prompt: str, timeout: int = 300, log_fn=None) -> subprocess.CompletedProcess | None:
     while True:
+        slots = CLAUDE.acquire()
         try:
             result = subprocess.run(
                 ['claude', '-p', '--model', model],
@@ -55,66 +225,1064 @@ def run_claude(model: str, prompt: str, timeout: int = 300, log_fn=None) -> subp
             if log_fn:
                 log_fn(f"خطا در اجرای Claude: {e}")
             return None
+        finally:
+            slots.release()
 
-        err = result.stderr.lower()
-        if result.returncode != 0 and ('rate limit' in err or '429' in err or 'too many' in err or 'overloaded' in err):
-            wait = 60
-            m = re.search(r'(\d+)\s*(?:second|ثانیه|sec)', output)
-            if m:
-                wait = int(m.group(1)) + 5
-            else:
-                m = re.search(r'(\d+)\s*(?:minute|دقیقه|min)', output)
-                if m:
-                    wait = int(m.group(1)) * 60 + 5
-            ts = datetime.now().strftime('%H:%M:%S')
-            print(f"[{ts}] ⏳ Claude rate limit — خواب {wait} ثانیه...", flush=True)
-            if log_fn:
-                log_fn(f"Claude rate limit — خواب {wait} ثانیه")
-            time.sleep(wait)
+        if _claude_backoff(result, log_fn):
             continue
-
         return result
 
 
+# ---------------------------------------------------------------------------
+# Prompt registry (کش قالب‌ها؛ با تغییر mtime/inode/size دوباره خونده میشن)
+# ---------------------------------------------------------------------------
+
+class PromptRegistry:
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def get(self, path: str) -> tuple[str, str] | None:
+        # خروجی: (متن، نسخه) — نسخه ۱۲ کاراکتر اول sha256 متنه
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry[0] == signature:
+                return entry[1], entry[2]
+        try:
+            text = Path(path).read_text(encoding='utf-8')
+        except OSError:
+            return None
+        version = hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]
+        with self._lock:
+            if entry and entry[2] != version:
+                self.reloads += 1
+                ts = datetime.now().strftime('%H:%M:%S')
+                print(f"[{ts}] 📝 {path} تغییر کرد — نسخه {entry[2]} → {version}", flush=True)
+            self._entries[path] = (signature, text, version)
+        return text, version
+
+    def versions(self) -> dict:
+        with self._lock:
+            return {path: entry[2] for path, entry in self._entries.items()}
+
+
+PROMPTS = PromptRegistry()
+
+
+# ---------------------------------------------------------------------------
+# Analysis cache (کلید: هش مدل + prompt + متن پروژه)
+# ---------------------------------------------------------------------------
+
+class AnalysisCache:
+
+    def __init__(self, cache_dir: str = "analysis_cache", max_entries: int = 500,
+                 max_age_days: float = 14, enabled: bool = True):
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def key(self, model: str, prompt: str, project_text: str) -> str:
+        # لینک پروژه در کلید نیست تا پروژه‌ی دوباره‌منتشرشده با همان متن هم hit بشه
+        body = '\n'.join(l for l in project_text.split('\n') if not l.startswith('لینک پروژه:'))
+        h = hashlib.sha256()
+        for part in (model, prompt, body):
+            h.update(part.encode('utf-8'))
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def get(self, key: str) -> str | None:
+        if not self.enabled:
+            return None
+        path = self.cache_dir / f"{key}.txt"
+        try:
+            if time.time() - path.stat().st_mtime > self.max_age:
+                path.unlink(missing_ok=True)
+                raise FileNotFoundError
+            text = path.read_text(encoding='utf-8')
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return text
+
+    def put(self, key: str, text: str):
+        self.cache_dir.mkdir(exist_ok=True)
+        path = self.cache_dir / f"{key}.txt"
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp.write_text(text, encoding='utf-8')
+        os.replace(tmp, path)
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        now = time.time()
+        entries = []
+        for path in self.cache_dir.glob("*.txt"):
+            try:
+                mtime = path.stat().st_mtime
+            except OSError:
+                continue
+            if now - mtime > self.max_age:
+                path.unlink(missing_ok=True)
+            else:
+                entries.append((mtime, path))
+        if len(entries) > self.max_entries:
+            entries.sort()
+            for _, path in entries[:len(entries) - self.max_entries]:
+                path.unlink(missing_ok=True)
+
+
+# ---------------------------------------------------------------------------
+# HTTP transport (یک Session keep-alive به ازای هر host)
+# ---------------------------------------------------------------------------
+
+class HttpTransport:
+
+    POOL_CONNECTIONS = 4
+    POOL_MAXSIZE = 16
+
+    def __init__(self, pool_maxsize: int = POOL_MAXSIZE):
+        self.pool_maxsize = pool_maxsize
+        self._sessions = {}
+        self._defaults = {}
+        self._requests = {}
+        self._lock = threading.Lock()
+
+    def configure(self, host: str, headers: dict = None, cookies: dict = None):
+        with self._lock:
+            self._defaults[host] = (dict(headers or {}), dict(cookies or {}))
+            session = self._sessions.get(host)
+        if session is not None:
+            session.headers.update(headers or {})
+            session.cookies.update(cookies or {})
+
+    def session(self, url: str) -> requests.Session:
+        host = urlsplit(url).netloc
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.POOL_CONNECTIONS,
+                                      pool_maxsize=self.pool_maxsize)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                headers, cookies = self._defaults.get(host, ({}, {}))
+                session.headers.update(headers)
+                session.cookies.update(cookies)
+                self._sessions[host] = session
+                self._requests[host] = 0
+            self._requests[host] += 1
+        return session
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        return self.session(url).request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def stats(self) -> dict:
+        # تعداد اتصال‌های واقعی از poolهای urllib3 (مستقیم و پروکسی) خونده میشه
+        with self._lock:
+            sessions = dict(self._sessions)
+            sent = dict(self._requests)
+        out = {}
+        for host, session in sessions.items():
+            connections = 0
+            for adapter in {id(a): a for a in session.adapters.values()}.values():
+                managers = [adapter.poolmanager, *adapter.proxy_manager.values()]
+                for manager in managers:
+                    if manager is None:
+                        continue
+                    for key in list(manager.pools.keys()):
+                        pool = manager.pools.get(key)
+                        if pool is not None:
+                            connections += pool.num_connections
+            out[host] = {
+                "requests": sent.get(host, 0),
+                "connections": connections,
+                "reused": max(0, sent.get(host, 0) - connections),
+            }
+        return out
+
+
+HTTP = HttpTransport()
+
+
+# ---------------------------------------------------------------------------
+# Paginator (تنبل، با توقف زودهنگام، prefetch صفحه بعد و retry هر صفحه)
+# ---------------------------------------------------------------------------
+
+class Paginator:
+
+    PREFETCH_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix='prefetch')
+
+    def __init__(self, fetch_page, start: int = 1, max_pages: int = None,
+                 stop_when=None, prefetch: bool = False, retries: int = 2,
+                 backoff: float = 1.0, on_error=None, keep=None, stop_page=None):
+        # fetch_page(page) -> (items, last_page) و در صورت خطا exception میده
+        # stop_when روی هر آیتم، stop_page روی کل صفحه (بعد از yield آیتم‌های keep شده)
+        self.fetch_page = fetch_page
+        self.start = start
+        self.max_pages = max_pages
+        self.stop_when = stop_when
+        self.keep = keep
+        self.stop_page = stop_page
+        self.prefetch = prefetch
+        self.retries = retries
+        self.backoff = backoff
+        self.on_error = on_error
+        self.pages_fetched = 0
+        self.failed_pages = []
+        self.stopped = None
+
+    @property
+    def errors(self) -> int:
+        return len(self.failed_pages)
+
+    @property
+    def complete(self) -> bool:
+        # همه‌ی صفحه‌های درخواست‌شده بدون خطا رسیدن؛ فقط در این حالت mark جلو میره
+        return not self.failed_pages and self.stopped != 'error'
+
+    def _load(self, page: int):
+        for attempt in range(self.retries + 1):
+            try:
+                result = self.fetch_page(page)
+                self.pages_fetched += 1
+                return result
+            except Exception as e:
+                if attempt == self.retries:
+                    if self.on_error:
+                        self.on_error(page, e)
+                    return None
+                time.sleep(self.backoff * (2 ** attempt))
+
+    def __iter__(self):
+        last_allowed = self.start + self.max_pages - 1 if self.max_pages else None
+        page = self.start
+        last_page = None
+        pending = None
+        try:
+            while True:
+                result = pending.result() if pending else self._load(page)
+                pending = None
+
+                if result is None:
+                    self.failed_pages.append(page)
+                    # صفحه‌ی خراب رد میشه، به شرطی که بدونیم صفحه‌ی بعدی وجود داره
+                    if last_page is None or page >= last_page:
+                        self.stopped = 'error'
+                        return
+                    items = []
+                else:
+                    items, last_page = result
+                    last_page = last_page or page
+                    if not items:
+                        self.stopped = 'empty'
+                        return
+
+                has_next = page < last_page and (last_allowed is None or page < last_allowed)
+                if self.prefetch and has_next:
+                    pending = self.PREFETCH_POOL.submit(self._load, page + 1)
+
+                for item in items:
+                    if self.stop_when and self.stop_when(item):
+                        self.stopped = 'predicate'
+                        return
+                    if self.keep and not self.keep(item):
+                        continue
+                    yield item
+
+                if items and self.stop_page and self.stop_page(items):
+                    self.stopped = 'predicate'
+                    return
+                if not has_next:
+                    self.stopped = 'last_page' if page >= last_page else 'max_pages'
+                    return
+                page += 1
+        finally:
+            if pending:
+                pending.cancel()
+
+
+# ---------------------------------------------------------------------------
+# State store (seen_projects / tracking / counters / meta)
+# ---------------------------------------------------------------------------
+
+COUNTER_KEYS = ("total_fetched", "total_analyzed", "total_submitted", "total_failed")
+
+
+def _empty_tracking() -> dict:
+    return {**{k: 0 for k in COUNTER_KEYS}, "projects": {}}
+
+
+class JsonStateStore:
+    # رفتار قدیمی: بازنویسی کامل فایل‌ها بعد از هر پروژه
+
+    name = "json"
+
+    def __init__(self, cache_file: str = "seen_projects.json",
+                 tracking_file: str = "tracking.json", meta_file: str = "state_meta.json",
+                 context_file: str = "project_context.json"):
+        self.cache_file = cache_file
+        self.tracking_file = tracking_file
+        self.meta_file = meta_file
+        self.context_file = context_file
+        self.seen = set()
+        self.tracking = _empty_tracking()
+        self.meta = {}
+        self.contexts = {}
+        self._lock = threading.Lock()
+
+    def _read(self, path: str, default):
+        try:
+            if Path(path).exists():
+                with open(path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except Exception:
+            pass
+        return default
+
+    def _write(self, path: str, data):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+    def load(self) -> tuple[set, dict]:
+        self.seen = set(self._read(self.cache_file, []))
+        self.tracking = self._read(self.tracking_file, None) or _empty_tracking()
+        self.meta = self._read(self.meta_file, {})
+        self.contexts = self._read(self.context_file, {})
+        return self.seen, self.tracking
+
+    def persist_project(self, project_id: int):
+        with self._lock:
+            self._write(self.cache_file, list(self.seen))
+            self._write(self.tracking_file, self.tracking)
+
+    def add_seen(self, project_id: int):
+        with self._lock:
+            self.seen.add(project_id)
+            self._write(self.cache_file, list(self.seen))
+
+    def get_meta(self, key: str, default=None):
+        with self._lock:
+            return self.meta.get(key, default)
+
+    def set_meta(self, key: str, value):
+        with self._lock:
+            self.meta[key] = value
+            self._write(self.meta_file, self.meta)
+
+    def get_context(self, project_id: int) -> dict | None:
+        with self._lock:
+            return self.contexts.get(str(project_id))
+
+    def put_context(self, project_id: int, context: dict):
+        with self._lock:
+            self.contexts[str(project_id)] = context
+            self._write(self.context_file, self.contexts)
+
+    def summary(self, limit: int = 10) -> dict:
+        projects = self.tracking.get("projects", {})
+        recent = sorted(projects.items(), key=lambda kv: kv[1].get("fetched_at", ""), reverse=True)
+        daily = {}
+        for entry in projects.values():
+            day = (entry.get("fetched_at") or "")[:10]
+            row = daily.setdefault(day, [0, 0])
+            row[0] += 1
+            row[1] += bool(entry.get("submitted"))
+        return {
+            "counters": {k: self.tracking.get(k, 0) for k in COUNTER_KEYS},
+            "seen": len(self.seen),
+            "tracked": len(projects),
+            "recent": [(int(pid), entry) for pid, entry in recent[:limit]],
+            "daily": sorted(((d, *v) for d, v in daily.items() if d), reverse=True)[:7],
+        }
+
+    def close(self):
+        pass
+
+
+class SqliteStateStore:
+    # یک ردیف به ازای هر پروژه؛ بدون بازنویسی تاریخچه
+
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS seen_projects (
+            id INTEGER PRIMARY KEY,
+            seen_at TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS tracking (
+            project_id INTEGER PRIMARY KEY,
+            title TEXT,
+            fetched_at TEXT,
+            analyzed INTEGER,
+            submitted INTEGER,
+            priority REAL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS tracking_fetched_at ON tracking (fetched_at);
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS project_context (
+            project_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, db_file: str = "karlancer.db", legacy: JsonStateStore = None):
+        self.db_file = db_file
+        self.legacy = legacy or JsonStateStore()
+        self.tracking = _empty_tracking()
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+
+    def load(self) -> tuple[set, dict]:
+        if self.get_meta("migrated_json") is None:
+            self._migrate_json()
+        with self._lock:
+            seen = {row[0] for row in self.conn.execute("SELECT id FROM seen_projects")}
+            for name, value in self.conn.execute("SELECT name, value FROM counters"):
+                self.tracking[name] = value
+        self.seen = seen
+        # تاریخچه‌ی projects فقط در دیتابیس می‌مونه، نه در حافظه
+        return seen, self.tracking
+
+    def _migrate_json(self):
+        seen, tracking = self.legacy.load()
+        meta = self.legacy.meta
+        now = datetime.now().isoformat()
+        with self._lock:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO seen_projects (id, seen_at) VALUES (?, ?)",
+                [(pid, now) for pid in seen],
+            )
+            for pid, entry in tracking.get("projects", {}).items():
+                self._upsert_tracking(int(pid), entry)
+            for name in COUNTER_KEYS:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO counters (name, value) VALUES (?, ?)",
+                    (name, int(tracking.get(name, 0))),
+                )
+            for key, value in meta.items():
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False)),
+                )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO project_context (project_id, data) VALUES (?, ?)",
+                [(int(pid), json.dumps(ctx, ensure_ascii=False)) for pid, ctx in self.legacy.contexts.items()],
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_json', ?)",
+                (json.dumps(now),),
+            )
+            self.conn.execute("COMMIT")
+        if seen or tracking.get("projects"):
+            print(f"🗄️  {len(seen)} پروژه دیده‌شده و {len(tracking.get('projects', {}))} ردیف tracking "
+                  f"از JSON به {self.db_file} منتقل شد", flush=True)
+
+    def _upsert_tracking(self, project_id: int, entry: dict):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO tracking "
+            "(project_id, title, fetched_at, analyzed, submitted, priority, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (project_id, entry.get("title"), entry.get("fetched_at"),
+             int(bool(entry.get("analyzed"))), int(bool(entry.get("submitted"))),
+             entry.get("priority"), json.dumps(entry, ensure_ascii=False)),
+        )
+
+    def persist_project(self, project_id: int):
+        # ردیف بعد از نوشتن از حافظه حذف میشه تا dict در طول اجرا بزرگ نشه
+        entry = self.tracking["projects"].pop(str(project_id), None)
+        with self._lock:
+            self.conn.execute("BEGIN")
+            self.conn.execute(
+                "INSERT OR IGNORE INTO seen_projects (id, seen_at) VALUES (?, ?)",
+                (project_id, datetime.now().isoformat()),
+            )
+            if entry is not None:
+                self._upsert_tracking(project_id, entry)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO counters (name, value) VALUES (?, ?)",
+                [(name, int(self.tracking.get(name, 0))) for name in COUNTER_KEYS],
+            )
+            self.conn.execute("COMMIT")
+
+    def add_seen(self, project_id: int):
+        with self._lock:
+            self.seen.add(project_id)
+            self.conn.execute(
+                "INSERT OR IGNORE INTO seen_projects (id, seen_at) VALUES (?, ?)",
+                (project_id, datetime.now().isoformat()),
+            )
+
+    def get_meta(self, key: str, default=None):
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, key: str, value):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                (key, json.dumps(value, ensure_ascii=False)),
+            )
+
+    def get_context(self, project_id: int) -> dict | None:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT data FROM project_context WHERE project_id = ?", (project_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_context(self, project_id: int, context: dict):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO project_context (project_id, data) VALUES (?, ?)",
+                (project_id, json.dumps(context, ensure_ascii=False)),
+            )
+
+    def summary(self, limit: int = 10) -> dict:
+        with self._lock:
+            counters = dict(self.conn.execute("SELECT name, value FROM counters"))
+            seen = self.conn.execute("SELECT COUNT(*) FROM seen_projects").fetchone()[0]
+            tracked = self.conn.execute("SELECT COUNT(*) FROM tracking").fetchone()[0]
+            recent = self.conn.execute(
+                "SELECT project_id, data FROM tracking ORDER BY fetched_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+            daily = self.conn.execute(
+                "SELECT substr(fetched_at, 1, 10) AS day, COUNT(*), SUM(submitted) "
+                "FROM tracking WHERE fetched_at IS NOT NULL GROUP BY day ORDER BY day DESC LIMIT 7"
+            ).fetchall()
+        return {
+            "counters": {k: counters.get(k, 0) for k in COUNTER_KEYS},
+            "seen": seen,
+            "tracked": tracked,
+            "recent": [(pid, json.loads(data)) for pid, data in recent],
+            "daily": daily,
+        }
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class JournalStateStore(JsonStateStore):
+    # فایل‌محور: هر تغییر یک خط JSON با fsync؛ snapshot + فشرده‌سازی بعد از آستانه حجم
+
+    name = "journal"
+
+    COMPACT_BYTES = 4 * 1024 * 1024
+
+    def __init__(self, journal_file: str = "state.journal",
+                 snapshot_file: str = "state.snapshot.json",
+                 compact_bytes: int = COMPACT_BYTES):
+        super().__init__()
+        self.journal_file = Path(journal_file)
+        self.snapshot_file = Path(snapshot_file)
+        self.compact_bytes = compact_bytes
+        self._fh = None
+        self._size = 0
+
+    def load(self) -> tuple[set, dict]:
+        if not self.snapshot_file.exists() and not self.journal_file.exists():
+            # اولین اجرا: فایل‌های JSON قدیمی یک بار خونده میشن
+            super().load()
+            self._write_snapshot()
+        else:
+            snap = self._read(self.snapshot_file, {})
+            self.seen = set(snap.get("seen", []))
+            self.tracking = snap.get("tracking") or _empty_tracking()
+            self.meta = snap.get("meta", {})
+            self.contexts = snap.get("contexts", {})
+        self._replay()
+        self._fh = open(self.journal_file, 'ab')
+        self._size = self._fh.tell()
+        return self.seen, self.tracking
+
+    def _replay(self):
+        if not self.journal_file.exists():
+            return
+        good = 0
+        with open(self.journal_file, 'rb') as f:
+            for raw in f:
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    break
+                self._apply(record)
+                good += len(raw)
+        if good < self.journal_file.stat().st_size:
+            # خط ناقص انتهای فایل (crash وسط نوشتن) دور ریخته میشه
+            with open(self.journal_file, 'r+b') as f:
+                f.truncate(good)
+
+    def _apply(self, record: dict):
+        op = record.get("op")
+        if op == "project":
+            self.seen.add(record["id"])
+            if record.get("entry") is not None:
+                self.tracking["projects"][str(record["id"])] = record["entry"]
+            self.tracking.update(record.get("counters", {}))
+        elif op == "seen":
+            self.seen.add(record["id"])
+        elif op == "meta":
+            self.meta[record["key"]] = record["value"]
+        elif op == "context":
+            self.contexts[str(record["id"])] = record["context"]
+
+    def _append(self, record: dict):
+        line = (json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+        self._fh.write(line)
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._size += len(line)
+        if self._size > self.compact_bytes:
+            self._compact()
+
+    def _write_snapshot(self):
+        tmp = self.snapshot_file.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({"seen": list(self.seen), "tracking": self.tracking, "meta": self.meta,
+                       "contexts": self.contexts},
+                      f, ensure_ascii=False, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_file)
+        try:
+            fd = os.open(self.snapshot_file.parent, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError:
+            pass
+
+    def _compact(self):
+        # رکوردها idempotent هستن؛ crash بین snapshot و truncate فقط باعث replay تکراری میشه
+        self._write_snapshot()
+        self._fh.close()
+        self._fh = open(self.journal_file, 'wb')
+        os.fsync(self._fh.fileno())
+        self._size = 0
+
+    def persist_project(self, project_id: int):
+        entry = self.tracking["projects"].get(str(project_id))
+        with self._lock:
+            self._append({
+                "op": "project", "id": project_id, "entry": entry,
+                "counters": {k: self.tracking.get(k, 0) for k in COUNTER_KEYS},
+            })
+
+    def add_seen(self, project_id: int):
+        with self._lock:
+            self.seen.add(project_id)
+            self._append({"op": "seen", "id": project_id})
+
+    def set_meta(self, key: str, value):
+        with self._lock:
+            self.meta[key] = value
+            self._append({"op": "meta", "key": key, "value": value})
+
+    def put_context(self, project_id: int, context: dict):
+        with self._lock:
+            self.contexts[str(project_id)] = context
+            self._append({"op": "context", "id": project_id, "context": context})
+
+    def close(self):
+        with self._lock:
+            if self._fh:
+                self._fh.close()
+                self._fh = None
+
+
+STATE_BACKENDS = {
+    "sqlite": SqliteStateStore,
+    "journal": JournalStateStore,
+    "json": JsonStateStore,
+}
+
+
+def open_state_store(backend: str = "sqlite"):
+    return STATE_BACKENDS[backend]()
+
+
+def print_state_stats(store, limit: int = 10):
+    store.load()
+    s = store.summary(limit)
+    c = s["counters"]
+    print("=" * 80)
+    print(f"🗄️  وضعیت ({store.name})")
+    print("=" * 80)
+    print(f"  🔍 دریافت: {c['total_fetched']}   🧠 تحلیل: {c['total_analyzed']}   "
+          f"📤 ارسال: {c['total_submitted']}   ❌ خطا: {c['total_failed']}")
+    print(f"  👁️  پروژه‌های دیده‌شده: {s['seen']}   📋 ردیف‌های tracking: {s['tracked']}")
+    rule_hits = store.get_meta("rule_hits", {})
+    if rule_hits:
+        print("\n🚦 قوانین فیلتر (hit / رد):")
+        for rule, st in sorted(rule_hits.items(), key=lambda kv: -kv[1]["rejects"]):
+            print(f"  {rule}: {st['hits']} / {st['rejects']}")
+    if s["daily"]:
+        print("\n📅 روزانه (تعداد / ارسال):")
+        for day, total, submitted in s["daily"]:
+            print(f"  {day}: {total} / {submitted or 0}")
+    if s["recent"]:
+        print(f"\n🕒 آخرین {len(s['recent'])} پروژه:")
+        for pid, entry in s["recent"]:
+            status = "📤" if entry.get("submitted") else ("🧠" if entry.get("analyzed") else "❌")
+            print(f"  {status} {pid}  {(entry.get('fetched_at') or '')[:16]}  "
+                  f"p={entry.get('priority') or '-'}  v={entry.get('prompt_version') or '-'}  "
+                  f"{(entry.get('title') or '')[:50]}")
+    store.close()
+
+
+# ---------------------------------------------------------------------------
+# Scheduler (jobهای دوره‌ای مستقل، بدون drift و بدون همپوشانی)
+# ---------------------------------------------------------------------------
+
+class PeriodicJob:
+
+    def __init__(self, name: str, fn, interval: float, jitter: float = 0.0,
+                 adaptive: bool = False, delay: float = 0.0):
+        # adaptive: خروجی fn فاصله تا اجرای بعدیه (مثل polling چت)
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.jitter = jitter
+        self.adaptive = adaptive
+        self.anchor = time.monotonic() + delay
+        self.next_run = self.anchor
+        self.running = False
+        self.runs = 0
+        self.skipped = 0
+        self.failures = 0
+        self.last_time = 0.0
+        self.max_time = 0.0
+        self.total_time = 0.0
+
+    def advance(self, now: float, skip: bool = False):
+        # زمان بعدی از anchor حساب میشه نه از پایان اجرا، پس زمان اجرا drift ایجاد نمی‌کنه؛
+        # همه نوبت‌های ردشده (خود این نوبت اگه skip باشه + عقب‌افتاده‌ها) فقط همینجا شمرده میشن
+        self.skipped += skip
+        self.anchor += self.interval
+        while self.anchor <= now:
+            self.anchor += self.interval
+            self.skipped += 1
+        self.next_run = self.anchor + random.uniform(0, self.jitter)
+
+    def metrics(self) -> str:
+        avg = self.total_time / self.runs if self.runs else 0.0
+        return (f"{self.name}: {self.runs} اجرا، avg={avg:.1f}s max={self.max_time:.1f}s "
+                f"last={self.last_time:.1f}s، {self.skipped} رد، {self.failures} خطا")
+
+
+class Scheduler:
+
+    def __init__(self, log_fn=print):
+        self.jobs = []
+        self.log_fn = log_fn
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def add(self, job: PeriodicJob) -> PeriodicJob:
+        self.jobs.append(job)
+        return job
+
+    def _execute(self, job: PeriodicJob):
+        start = time.monotonic()
+        result = None
+        failed = False
+        try:
+            result = job.fn()
+        except Exception as e:
+            failed = True
+            self.log_fn(f"خطا در job {job.name}: {e}")
+        elapsed = time.monotonic() - start
+        with self._lock:
+            job.runs += 1
+            job.failures += failed
+            job.last_time = elapsed
+            job.max_time = max(job.max_time, elapsed)
+            job.total_time += elapsed
+            if job.adaptive:
+                delay = result if isinstance(result, (int, float)) else job.interval
+                job.next_run = time.monotonic() + delay + random.uniform(0, job.jitter)
+            job.running = False
+
+    def _tick(self) -> float:
+        now = time.monotonic()
+        with self._lock:
+            for job in self.jobs:
+                if now < job.next_run:
+                    continue
+                if job.running:
+                    # اجرای قبلی هنوز تموم نشده → این نوبت رد میشه
+                    job.advance(now, skip=True)
+                    continue
+                job.running = True
+                if job.adaptive:
+                    job.next_run = float('inf')
+                else:
+                    job.advance(now)
+                threading.Thread(target=self._execute, args=(job,),
+                                 name=f"job-{job.name}", daemon=True).start()
+            upcoming = min((j.next_run for j in self.jobs), default=now + 60)
+        return max(0.05, min(upcoming - time.monotonic(), 60))
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            self._stop.wait(self._tick())
+
+    def stop(self):
+        self._stop.set()
+
+    def wait_idle(self, names=None, timeout: float = 30) -> bool:
+        # jobها daemon هستن؛ قبل از خروج به اجرای در حال انجام فرصت تموم شدن داده میشه
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                busy = [j.name for j in self.jobs if j.running and (names is None or j.name in names)]
+            if not busy:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.2)
+
+    def metrics(self) -> list:
+        with self._lock:
+            return [job.metrics() for job in self.jobs]
+
+
 # ---------------------------------------------------------------------------
 # Telegram Logger
 # ---------------------------------------------------------------------------
 
 class TelegramLogger:
 
+    QUEUE_SIZE = 100
+    BATCH_WINDOW = 2.0
+    MIN_INTERVAL = 1.1      # تلگرام حدود یک پیام در ثانیه برای هر چت
+    MAX_TEXT = 4000
+    MAX_RETRIES = 4
+    DIGEST_SEPARATOR = "\n\n〰️〰️〰️\n\n"
+    HTML_TAG = re.compile(r'<(/?)([a-zA-Z-]+)[^<>]*>')
+
     def __init__(self, bot_token: str, chat_id: str):
         self.bot_token = bot_token
         self.chat_id = chat_id
         self.api_url = f"https://api.telegram.org/bot{bot_token}"
+        self.enabled = True
+        self._queue = deque(maxlen=self.QUEUE_SIZE)
+        self._cond = threading.Condition()
+        self._worker = None
+        self._busy = False
+        self._closed = False
+        self._flushing = 0
+        self._last_sent = 0.0
+        self._rejected = False
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
 
     def send_message(self, text: str, parse_mode: str = "HTML") -> bool:
-        try:
-            response = requests.post(
-                f"{self.api_url}/sendMessage",
-                json={
-                    "chat_id": self.chat_id,
-                    "text": text,
-                    "parse_mode": parse_mode,
-                    "disable_web_page_preview": True,
-                },
-                timeout=10,
-            )
-            if response.status_code == 200:
-                return True
-            print(f"⚠️  خطا در ارسال به تلگرام: {response.status_code}")
-            return False
-        except Exception as e:
-            print(f"⚠️  خطا در ارسال به تلگرام: {e}")
-            return False
+        # فقط در صف گذاشته میشه؛ ارسال در worker انجام میشه تا مسیر اصلی معطل نشه
+        with self._cond:
+            if self._closed or not self.enabled:
+                return False
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append((text, parse_mode))
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='telegram', daemon=True)
+                self._worker.start()
+            self._cond.notify_all()
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                # کمی صبر تا پیام‌های یک burst با هم جمع بشن
+                deadline = time.monotonic() + self.BATCH_WINDOW
+                while not self._closed and not self._flushing:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if not self._queue:
+                    continue
+                batch = self._take_batch()
+                self._busy = True
+            try:
+                text, parse_mode = self._digest(batch)
+                if self._post(text, parse_mode):
+                    self.sent += len(batch)
+                elif self._rejected and len(batch) > 1:
+                    # یک پیام خراب کل digest رو رد کرده؛ تک‌تک بفرست تا بقیه از دست نرن
+                    for item, item_mode in batch:
+                        if self._post(self._truncate(item, item_mode), item_mode):
+                            self.sent += 1
+                        else:
+                            self.failed += 1
+                else:
+                    self.failed += len(batch)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _take_batch(self) -> list:
+        batch = [self._queue.popleft()]
+        size = len(batch[0][0])
+        while self._queue:
+            text, parse_mode = self._queue[0]
+            if parse_mode != batch[0][1] or size + len(text) + len(self.DIGEST_SEPARATOR) > self.MAX_TEXT:
+                break
+            batch.append(self._queue.popleft())
+            size += len(text) + len(self.DIGEST_SEPARATOR)
+        return batch
+
+    def _digest(self, batch: list) -> tuple:
+        parse_mode = batch[0][1]
+        if len(batch) == 1:
+            return self._truncate(batch[0][0], parse_mode), parse_mode
+        header = f"📦 <b>{len(batch)} اعلان</b>\n\n" if parse_mode == "HTML" else f"📦 {len(batch)} اعلان\n\n"
+        text = header + self.DIGEST_SEPARATOR.join(text for text, _ in batch)
+        return self._truncate(text, parse_mode), parse_mode
+
+    def _truncate(self, text: str, parse_mode: str) -> str:
+        if len(text) <= self.MAX_TEXT:
+            return text
+        # برش روی آخرین خط کامل، بدون نصفه موندن تگ یا entity و با بستن تگ‌های باز
+        cut = text[:self.MAX_TEXT - 100]
+        newline = cut.rfind("\n")
+        if newline > len(cut) // 2:
+            cut = cut[:newline]
+        if parse_mode != "HTML":
+            return cut + "\n…"
+        cut = re.sub(r'<[^<>]*$', '', cut)
+        cut = re.sub(r'&[a-zA-Z0-9#]*$', '', cut)
+        stack = []
+        for match in self.HTML_TAG.finditer(cut):
+            closing, tag = match.group(1), match.group(2).lower()
+            if not closing:
+                stack.append(tag)
+            elif tag in stack:
+                del stack[len(stack) - 1 - stack[::-1].index(tag)]
+        return cut + "\n…" + "".join(f"</{tag}>" for tag in reversed(stack))
+
+    def _post(self, text: str, parse_mode: str = "HTML") -> bool:
+        self._rejected = False
+        for attempt in range(self.MAX_RETRIES + 1):
+            wait = self._last_sent + self.MIN_INTERVAL - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            retry_after = 2 ** attempt
+            try:
+                response = HTTP.post(
+                    f"{self.api_url}/sendMessage",
+                    json={
+                        "chat_id": self.chat_id,
+                        "text": text,
+                        "parse_mode": parse_mode,
+                        "disable_web_page_preview": True,
+                    },
+                    timeout=10,
+                )
+                self._last_sent = time.monotonic()
+                if response.status_code == 200:
+                    return True
+                if response.status_code == 429:
+                    try:
+                        retry_after = response.json().get('parameters', {}).get('retry_after', retry_after)
+                    except ValueError:
+                        pass
+                elif response.status_code < 500:
+                    print(f"⚠️  خطا در ارسال به تلگرام: {response.status_code}")
+                    self._rejected = True
+                    return False
+                print(f"⚠️  خطا در ارسال به تلگرام: {response.status_code} — تلاش مجدد تا {retry_after} ثانیه")
+            except Exception as e:
+                print(f"⚠️  خطا در ارسال به تلگرام: {e}")
+            if attempt < self.MAX_RETRIES:
+                time.sleep(retry_after)
+        return False
+
+    def disable(self):
+        with self._cond:
+            self.enabled = False
+            self._queue.clear()
+            self._cond.notify_all()
+
+    @property
+    def queued(self) -> int:
+        with self._cond:
+            return len(self._queue)
+
+    def flush(self, timeout: float = 15) -> bool:
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._flushing += 1
+            self._cond.notify_all()
+            try:
+                while self._queue or self._busy:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or self._worker is None:
+                        return False
+                    self._cond.wait(min(remaining, 0.5))
+            finally:
+                self._flushing -= 1
+        return True
+
+    def close(self, timeout: float = 15) -> bool:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        done = self.flush(timeout)
+        if self.dropped:
+            print(f"⚠️  {self.dropped} اعلان تلگرام به دلیل پر شدن صف حذف شد")
+        return done
 
     def test_connection(self) -> bool:
         try:
-            response = requests.get(f"{self.api_url}/getMe", timeout=5)
+            response = HTTP.get(f"{self.api_url}/getMe", timeout=5)
             if response.status_code == 200:
                 bot_name = response.json().get('result', {}).get('first_name', 'Unknown')
                 print(f"✅ اتصال به بات موفق: {bot_name}")
-                return self.send_message(
-                    f"🧪 <b>تست اتصال موفق</b>\n\nبات: {bot_name}\n"
+                return self._post(
+                    f"🧪 <b>تست اتصال موفق</b>\n\nبات: {html.escape(bot_name)}\n"
                     f"📅 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
                 )
             return False
@@ -136,13 +1304,13 @@ class TelegramLogger:
         self.send_message(
             f"✅ <b>پروپوزال ارسال شد!</b>\n\n"
             f"📋 ID: {project_id}\n"
-            f"📌 {title[:50]}{'...' if len(title) > 50 else ''}\n\n"
+            f"📌 {html.escape(title[:50])}{'...' if len(title) > 50 else ''}\n\n"
             f"🔗 لینک: https://www.karlancer.com/project/{project_id}"
         )
 
     def send_error(self, error_msg: str):
         self.send_message(
-            f"❌ <b>خطا رخ داد</b>\n\n{error_msg}\n\n"
+            f"❌ <b>خطا رخ داد</b>\n\n{html.escape(str(error_msg))}\n\n"
             f"📅 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
         )
 
@@ -158,6 +1326,59 @@ class TelegramLogger:
         )
 
 
+# ---------------------------------------------------------------------------
+# Room state cache (یک بار بارگذاری، نوشتن دسته‌ای فقط اتاق‌های تغییرکرده)
+# ---------------------------------------------------------------------------
+
+class RoomStateCache:
+
+    DEFAULT_STATE = {"last_responded_msg_id": 0, "status": "active"}
+
+    def __init__(self, chats_dir: Path):
+        self.chats_dir = chats_dir
+        self._states = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._load_all()
+
+    def _load_all(self):
+        if not self.chats_dir.is_dir():
+            return
+        for entry in os.scandir(self.chats_dir):
+            if not entry.is_dir():
+                continue
+            try:
+                with open(os.path.join(entry.path, "state.json"), 'r', encoding='utf-8') as f:
+                    self._states[entry.name] = json.load(f)
+            except (OSError, ValueError):
+                continue
+
+    def get(self, room_id) -> dict:
+        key = str(room_id)
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                state = self._states[key] = dict(self.DEFAULT_STATE)
+            return state
+
+    def mark_dirty(self, room_id):
+        with self._lock:
+            self._dirty.add(str(room_id))
+
+    def flush(self) -> int:
+        with self._lock:
+            dirty = [(key, json.dumps(self._states[key], ensure_ascii=False, indent=2))
+                     for key in self._dirty]
+            self._dirty.clear()
+        for key, data in dirty:
+            room_dir = self.chats_dir / key
+            room_dir.mkdir(parents=True, exist_ok=True)
+            tmp = room_dir / "state.json.tmp"
+            tmp.write_text(data, encoding='utf-8')
+            os.replace(tmp, room_dir / "state.json")
+        return len(dirty)
+
+
 # ---------------------------------------------------------------------------
 # Chat Manager
 # ---------------------------------------------------------------------------
@@ -168,12 +1389,24 @@ class ChatManager:
     MESSAGES_API_TPL = "https://www.karlancer.com/api/rooms/{}/messages-pg"
     SEND_API = "https://www.karlancer.com/api/messages"
     MY_USER_ID = 100660
+    CHAT_PROMPT_FILE = "chat_prompt.txt"
+
+    # بودجه‌ی توکن هر پاسخ (تخمینی، حدود ۳ کاراکتر برای هر توکن)
+    CHARS_PER_TOKEN = 3
+    CONTEXT_TOKEN_BUDGET = 2500
+    RECENT_TURNS = 8
+    MIN_RECENT_TURNS = 2
+    SUMMARY_BATCH = 6
+    PROJECT_CTX_TOKENS = 600
+    PROPOSAL_CTX_TOKENS = 500
+    SUMMARY_TOKENS = 350
 
     GITHUB_API = "https://api.github.com"
 
     def __init__(self, headers: dict, submit_headers: dict, cookies: dict,
                  model: str = "sonnet", tg: TelegramLogger = None,
-                 github_token: str = ""):
+                 github_token: str = "", chat_workers: int = 3, fetch_workers: int = 8,
+                 state=None, fast_interval: int = 15, max_interval: int = 300):
         self.headers = headers
         self.submit_headers = submit_headers
         self.cookies = cookies
@@ -181,16 +1414,27 @@ class ChatManager:
         self.tg = tg
         self.github_token = github_token
         self.github_user = "czmobin"
+        self.chat_workers = chat_workers
+        self.fetch_workers = fetch_workers
+        self.state = state
+        self.room_index = state.get_meta("room_index", {}) if state else {}
+
+        self.fast_interval = fast_interval
+        self.max_interval = max(max_interval, fast_interval)
+        self._idle_delay = fast_interval
+        self._last_active = 0.0
+        self._had_activity = False
+        self.reply_latencies = deque(maxlen=500)
+        self._latency_lock = threading.Lock()
+
+        if github_token:
+            HTTP.configure(urlsplit(self.GITHUB_API).netloc, headers={
+                "Authorization": f"token {github_token}",
+                "Accept": "application/vnd.github.v3+json",
+            })
 
         self.chats_dir = Path("chats")
-        self.chats_dir.mkdir(exist_ok=True)
-        self.chat_prompt = self._load_chat_prompt()
-
-    def _load_chat_prompt(self) -> str:
-        path = Path("chat_prompt.txt")
-        if path.exists():
-            return path.read_text(encoding='utf-8')
-        return ""
+        self.room_states = RoomStateCache(self.chats_dir)
 
     # -- logging (standalone) ---------------------------------------------------
 
@@ -208,26 +1452,22 @@ class ChatManager:
 
     # -- API helpers ------------------------------------------------------------
 
+    def _fetch_rooms_page(self, page: int) -> tuple[list, int]:
+        resp = HTTP.get(self.ROOMS_API, params={"page": page}, timeout=15)
+        resp.raise_for_status()
+        data = resp.json().get("data", {})
+        return data.get("data", []), data.get("last_page", page + 1)
+
     def _fetch_rooms(self, pages: int = 2) -> list:
-        rooms = []
-        for page in range(1, pages + 1):
-            try:
-                resp = requests.get(
-                    self.ROOMS_API, headers=self.headers, cookies=self.cookies,
-                    params={"page": page}, timeout=15,
-                )
-                if resp.status_code == 200:
-                    data = resp.json().get("data", {}).get("data", [])
-                    rooms.extend(data)
-            except Exception as e:
-                self._log("error", f"دریافت اتاق‌ها صفحه {page}: {e}")
-        return rooms
+        return list(Paginator(
+            self._fetch_rooms_page, max_pages=pages, prefetch=True,
+            on_error=lambda page, e: self._log("error", f"دریافت اتاق‌ها صفحه {page}: {e}"),
+        ))
 
     def _fetch_messages(self, room_id: int) -> tuple:
         try:
-            resp = requests.get(
+            resp = HTTP.get(
                 self.MESSAGES_API_TPL.format(room_id),
-                headers=self.headers, cookies=self.cookies,
                 params={"page": 1}, timeout=15,
             )
             if resp.status_code == 200:
@@ -241,8 +1481,8 @@ class ChatManager:
 
     def _send_message(self, room_id: int, receptor_id: int, message: str) -> bool:
         try:
-            resp = requests.post(
-                self.SEND_API, headers=self.submit_headers, cookies=self.cookies,
+            resp = HTTP.post(
+                self.SEND_API, headers=self.submit_headers,
                 json={"receptor_id": receptor_id, "room_id": room_id,
                       "message": message, "file": ""},
                 timeout=10,
@@ -252,52 +1492,110 @@ class ChatManager:
             self._log("error", f"ارسال پیام به اتاق {room_id}: {e}")
             return False
 
-    # -- state persistence ------------------------------------------------------
+    # -- room change index ------------------------------------------------------
 
-    def _room_dir(self, room_id: int) -> Path:
-        d = self.chats_dir / str(room_id)
-        d.mkdir(exist_ok=True)
-        return d
+    ACTIVE_WINDOW = 600
+    RETRY_MAX = 1800
 
-    def _load_state(self, room_dir: Path) -> dict:
-        sf = room_dir / "state.json"
-        if sf.exists():
-            try:
-                with open(sf, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception:
-                pass
-        return {"last_responded_msg_id": 0, "status": "active"}
+    ROOM_FINGERPRINT_FIELDS = ("last_message", "last_message_id", "updated_at",
+                               "last_message_at", "unread_count", "unread")
+    ROOM_CHANGE_FIELDS = ("last_message_id", "updated_at", "last_message_at")
+
+    def _room_fingerprint(self, room: dict, strict: bool = True) -> str | None:
+        # بدون id یا زمان، متن تکراری (مثل «سلام») از پیام قبلی قابل تشخیص نیست → None یعنی همیشه بررسی کن
+        if strict and all(room.get(f) is None for f in self.ROOM_CHANGE_FIELDS):
+            return None
+        return json.dumps([room.get(f) for f in self.ROOM_FINGERPRINT_FIELDS],
+                          ensure_ascii=False, default=str)
+
+    def _settle(self, settled: dict, room: dict):
+        fingerprint = self._room_fingerprint(room)
+        if fingerprint is not None:
+            settled[str(room["id"])] = fingerprint
+
+    def _save_room_index(self, settled: dict):
+        if not settled:
+            return
+        self.room_index.update(settled)
+        if self.state:
+            self.state.set_meta("room_index", self.room_index)
+
+    # -- state persistence ------------------------------------------------------
 
-    def _save_state(self, room_dir: Path, state: dict):
-        with open(room_dir / "state.json", 'w', encoding='utf-8') as f:
-            json.dump(state, f, ensure_ascii=False, indent=2)
+    def _room_dir(self, room_id: int) -> Path:
+        # پوشه فقط موقع نوشتن ساخته میشه
+        return self.chats_dir / str(room_id)
+
+    def _load_state(self, room_id: int) -> dict:
+        return self.room_states.get(room_id)
+
+    def _save_state(self, room_id: int):
+        self.room_states.mark_dirty(room_id)
+
+    def _room_failed(self, room: dict, state: dict):
+        # backoff جدا برای هر اتاق خراب، تا یک اتاق polling رو همیشه سریع نگه نداره
+        failures = state.get("failures", 0) + 1
+        delay = min(self.fast_interval * 2 ** failures, self.RETRY_MAX)
+        state["failures"] = failures
+        state["next_retry_at"] = time.time() + delay
+        state["retry_fingerprint"] = self._room_fingerprint(room, strict=False)
+        self._save_state(room["id"])
+        self._log("warning", f"اتاق {room['id']}: تلاش مجدد تا {delay:.0f} ثانیه دیگر (خطای {failures})")
+
+    def _room_recovered(self, room_id: int, state: dict):
+        if state.pop("failures", None) is not None:
+            state.pop("next_retry_at", None)
+            state.pop("retry_fingerprint", None)
+            self._save_state(room_id)
+
+    def _in_backoff(self, room: dict, state: dict) -> bool:
+        if time.time() >= state.get("next_retry_at", 0):
+            return False
+        # پیام جدید (تغییر متادیتا) backoff رو می‌شکنه
+        return state.get("retry_fingerprint") == self._room_fingerprint(room, strict=False)
 
     # -- context building -------------------------------------------------------
 
+    def _project_index(self, pid) -> dict:
+        # اول از index وضعیت (O(1))؛ پروژه‌های قدیمی از فایل‌ها خونده و یک بار backfill میشن
+        try:
+            pid = int(pid)
+        except (TypeError, ValueError):
+            return {}
+        if self.state:
+            ctx = self.state.get_context(pid)
+            if ctx is not None:
+                return ctx
+        ctx = {}
+        input_file = Path(f"claude_input/project_{pid}.txt")
+        if input_file.exists():
+            ctx["summary"] = input_file.read_text(encoding='utf-8')
+        analysis_file = Path(f"proposals/project_{pid}_analysis.txt")
+        if analysis_file.exists():
+            content = analysis_file.read_text(encoding='utf-8')
+            idx = content.find("پروپوزال")
+            if idx != -1:
+                ctx["proposal"] = content[idx:idx + 2000]
+        if ctx and self.state:
+            self.state.put_context(pid, ctx)
+        return ctx
+
     def _get_project_context(self, projects: list) -> str:
         if not projects:
             return ""
         project = projects[0]
-        pid = project.get("project_id")
         title = project.get("title", "")
-        input_file = Path(f"claude_input/project_{pid}.txt")
-        if input_file.exists():
-            return f"اطلاعات پروژه:\n{input_file.read_text(encoding='utf-8')}"
+        summary = self._project_index(project.get("project_id")).get("summary")
+        if summary:
+            return f"اطلاعات پروژه:\n{summary}"
         return f"پروژه: {title}" if title else ""
 
     def _get_proposal_context(self, projects: list) -> str:
         if not projects:
             return ""
-        pid = projects[0].get("project_id")
-        analysis_file = Path(f"proposals/project_{pid}_analysis.txt")
-        if analysis_file.exists():
-            content = analysis_file.read_text(encoding='utf-8')
-            marker = "پروپوزال"
-            idx = content.find(marker)
-            if idx != -1:
-                proposal = content[idx:idx + 2000]
-                return f"پروپوزال ارسال‌شده:\n{proposal}"
+        proposal = self._project_index(projects[0].get("project_id")).get("proposal")
+        if proposal:
+            return f"پروپوزال ارسال‌شده:\n{proposal}"
         return ""
 
     def _format_conversation(self, messages: list) -> str:
@@ -324,14 +1622,10 @@ class ChatManager:
             return None
 
         repo_name = f"kar-{self._slugify(project_title)}"
-        gh_headers = {
-            "Authorization": f"token {self.github_token}",
-            "Accept": "application/vnd.github.v3+json",
-        }
 
         try:
-            resp = requests.post(
-                f"{self.GITHUB_API}/user/repos", headers=gh_headers,
+            resp = HTTP.post(
+                f"{self.GITHUB_API}/user/repos",
                 json={"name": repo_name, "private": True,
                       "description": project_desc[:200], "auto_init": True},
                 timeout=15,
@@ -454,11 +1748,96 @@ class ChatManager:
         state["repo_name"] = repo_name
         return repo_name
 
+    # -- bounded context ----------------------------------------------------------
+
+    def _tokens(self, text: str) -> int:
+        return len(text) // self.CHARS_PER_TOKEN + 1
+
+    def _clip(self, text: str, tokens: int) -> str:
+        limit = tokens * self.CHARS_PER_TOKEN
+        if len(text) <= limit:
+            return text
+        return text[:limit].rsplit(' ', 1)[0] + " …"
+
+    def _summarize(self, summary: str, messages: list) -> str | None:
+        prompt = (
+            "خلاصه‌ی زیر از یک مکالمه‌ی کاری با کارفرما در کارلنسر رو با پیام‌های جدید به‌روز کن. "
+            f"فقط خلاصه رو بنویس، حداکثر {self.SUMMARY_TOKENS * self.CHARS_PER_TOKEN} کاراکتر، "
+            "با حفظ توافق‌ها، مبلغ، زمان‌بندی، نیازمندی‌ها و سوال‌های باز.\n\n"
+            f"خلاصه‌ی فعلی:\n{summary or '(خالی)'}\n\n"
+            f"پیام‌های جدید:\n{self._format_conversation(messages)}"
+        )
+        result = run_claude(self.model, prompt, timeout=90,
+                            log_fn=lambda msg: self._log("error", msg))
+        if result and result.returncode == 0 and result.stdout.strip():
+            return self._clip(result.stdout.strip(), self.SUMMARY_TOKENS)
+        return None
+
+    def _build_context(self, room_id: int, state: dict, messages: list,
+                       project_ctx: str, proposal_ctx: str) -> tuple:
+        # چند پیام آخر کامل میان؛ پیام‌های بیرون از این پنجره تا وقتی تعدادشون به SUMMARY_BATCH
+        # نرسیده یا در بودجه جا میشن کامل می‌مونن و بعد یک‌جا در خلاصه‌ی state جمع میشن
+        upto = state.get("summary_upto_msg_id", 0)
+        unsummarized = [m for m in messages[self.RECENT_TURNS:] if m["id"] > upto]
+        # پیام‌های داخل پنجره که قبلاً موقع برش وارد خلاصه شدن دوباره کامل نمیان
+        fresh = sum(1 for m in messages[:self.RECENT_TURNS] if m["id"] > upto)
+        recent = messages[:max(fresh, self.MIN_RECENT_TURNS) + len(unsummarized)]
+        summary = state.get("summary", "")
+
+        project_ctx = self._clip(project_ctx, self.PROJECT_CTX_TOKENS)
+        proposal_ctx = self._clip(proposal_ctx, self.PROPOSAL_CTX_TOKENS)
+
+        def budget_for(summary: str) -> int:
+            block = f"خلاصه‌ی مکالمه‌ی قبلی:\n{summary}\n\n" if summary else ""
+            return (self.CONTEXT_TOKEN_BUDGET - self._tokens(project_ctx)
+                    - self._tokens(proposal_ctx) - self._tokens(block))
+
+        conversation = self._format_conversation(recent)
+        if unsummarized and (len(unsummarized) >= self.SUMMARY_BATCH
+                             or self._tokens(conversation) > budget_for(summary)):
+            updated = self._summarize(summary, unsummarized)
+            if updated:
+                summary = updated
+                state["summary"] = summary
+                upto = unsummarized[0]["id"]
+                state["summary_upto_msg_id"] = upto
+                self._save_state(room_id)
+                recent = messages[:max(fresh, self.MIN_RECENT_TURNS)]
+                conversation = self._format_conversation(recent)
+
+        # پیام‌هایی که برای جا شدن در بودجه حذف میشن اول وارد خلاصه میشن؛ اگه خلاصه‌سازی
+        # ناموفق باشه summary_upto جلو نمیره و همون پیام‌ها در batch بعدی خلاصه میشن
+        while True:
+            budget = budget_for(summary)
+            keep = len(recent)
+            while keep > self.MIN_RECENT_TURNS and self._tokens(self._format_conversation(recent[:keep])) > budget:
+                keep -= 1
+            dropped = [m for m in recent[keep:] if m["id"] > upto]
+            if dropped:
+                updated = self._summarize(summary, dropped)
+                if updated:
+                    summary = updated
+                    upto = dropped[0]["id"]
+                    state["summary"] = summary
+                    state["summary_upto_msg_id"] = upto
+                    self._save_state(room_id)
+            recent = recent[:keep]
+            conversation = self._format_conversation(recent)
+            if not dropped or not updated or budget_for(summary) >= self._tokens(conversation):
+                break
+
+        summary_block = f"خلاصه‌ی مکالمه‌ی قبلی:\n{summary}\n\n" if summary else ""
+        budget = budget_for(summary)
+        if self._tokens(conversation) > budget:
+            conversation = "…" + conversation[-max(budget, 1) * self.CHARS_PER_TOKEN:]
+        return project_ctx, proposal_ctx, summary_block + conversation
+
     # -- response generation ----------------------------------------------------
 
     def _generate_response(self, project_ctx: str, proposal_ctx: str,
                            conversation: str) -> tuple:
-        parts = [self.chat_prompt]
+        template = PROMPTS.get(self.CHAT_PROMPT_FILE)
+        parts = [template[0] if template else ""]
         if project_ctx:
             parts.append(project_ctx)
         if proposal_ctx:
@@ -487,6 +1866,67 @@ class ChatManager:
             return cleaned or None, approved
         return None, False
 
+    # -- reply latency ----------------------------------------------------------
+
+    def _message_time(self, msg: dict) -> float | None:
+        for key in ("created_at", "updated_at", "date"):
+            value = msg.get(key)
+            if not value:
+                continue
+            try:
+                return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+            except ValueError:
+                continue
+        return None
+
+    def _record_latency(self, msg: dict) -> float | None:
+        sent_at = self._message_time(msg)
+        if sent_at is None:
+            return None
+        latency = time.time() - sent_at
+        if not 0 <= latency < 86400:
+            return None
+        with self._latency_lock:
+            self.reply_latencies.append(latency)
+        return latency
+
+    def latency_summary(self) -> str:
+        with self._latency_lock:
+            samples = sorted(self.reply_latencies)
+        if not samples:
+            return ""
+        pick = lambda q: samples[min(len(samples) - 1, int(len(samples) * q))]
+        return (f"تاخیر پاسخ به کارفرما ({len(samples)} نمونه): "
+                f"p50={pick(0.5):.0f}s p90={pick(0.9):.0f}s max={samples[-1]:.0f}s")
+
+    # -- adaptive polling -------------------------------------------------------
+
+    def next_poll_delay(self, responded: int) -> float:
+        # مکالمه فعال → بررسی سریع؛ بیکار → backoff نمایی تا max_interval
+        now = time.monotonic()
+        if responded or self._had_activity:
+            self._last_active = now
+        if now - self._last_active < self.ACTIVE_WINDOW:
+            self._idle_delay = self.fast_interval
+            return self.fast_interval
+        self._idle_delay = min(self._idle_delay * 2, self.max_interval)
+        return self._idle_delay
+
+    def poll(self) -> float:
+        # یک دور بررسی؛ خروجی فاصله تا دور بعد برای scheduler است
+        responded = 0
+        try:
+            responded = self.check_and_respond()
+        except Exception as e:
+            self._log("error", f"خطا در پردازش چت‌ها: {e}")
+        if responded:
+            summary = self.latency_summary()
+            if summary:
+                self._log("info", summary)
+        delay = self.next_poll_delay(responded)
+        self._log("info", f"بررسی بعدی چت‌ها تا {delay:.0f} ثانیه دیگر")
+        return delay
+
     # -- main loop entry --------------------------------------------------------
 
     def check_and_respond(self) -> int:
@@ -496,38 +1936,99 @@ class ChatManager:
             self._log("info", "هیچ اتاقی دریافت نشد")
             return 0
 
-        responded = 0
+        candidates = []
+        unchanged = 0
+        backoff = 0
         for room in rooms:
             if room.get("is_archived"):
                 continue
 
-            room_id = room["id"]
-            room_dir = self._room_dir(room_id)
-            state = self._load_state(room_dir)
+            # متادیتای لیست اتاق‌ها عوض نشده → پیام جدیدی هم نیست
+            fingerprint = self._room_fingerprint(room)
+            if fingerprint is not None and self.room_index.get(str(room["id"])) == fingerprint:
+                unchanged += 1
+                continue
 
+            room_dir = self._room_dir(room["id"])
+            state = self._load_state(room["id"])
             if state.get("status") == "approved":
                 continue
 
             last_msg = room.get("last_message", "")
             if last_msg.startswith("پیشنهاد بر روی پروژه"):
                 continue
-
-            messages, projects = self._fetch_messages(room_id)
-            if not messages:
+            if self._in_backoff(room, state):
+                backoff += 1
                 continue
+            candidates.append((room, room_dir, state))
+
+        # فقط پیام جدید کارفرما یا پاسخ ارسال‌شده فعالیت حساب میشه، نه اتاقی که مدام خطا میده
+        self._had_activity = False
+        if unchanged:
+            self._log("info", f"{unchanged} اتاق بدون تغییر رد شد")
+        if backoff:
+            self._log("info", f"{backoff} اتاق در backoff خطا رد شد")
+        if not candidates:
+            self._log("info", "بررسی تمام شد. 0 پاسخ ارسال شد.")
+            return 0
 
-            newest = messages[0]
-            if newest["sender_id"] == self.MY_USER_ID:
-                continue
-            if newest["id"] <= state.get("last_responded_msg_id", 0):
-                continue
+        # پیام‌های همه اتاق‌ها همزمان گرفته میشن
+        workers = max(1, min(self.fetch_workers, len(candidates)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='chat-fetch') as pool:
+            fetched = list(pool.map(lambda c: self._fetch_messages(c[0]["id"]), candidates))
+
+        pending = []
+        settled = {}
+        responded = 0
+        try:
+            for (room, room_dir, state), (messages, projects) in zip(candidates, fetched):
+                if not messages:
+                    self._room_failed(room, state)
+                    continue
+                newest = messages[0]
+                if (newest["sender_id"] == self.MY_USER_ID
+                        or newest["id"] <= state.get("last_responded_msg_id", 0)):
+                    self._room_recovered(room["id"], state)
+                    self._settle(settled, room)
+                    continue
+                if newest["id"] > state.get("last_seen_msg_id", 0):
+                    state["last_seen_msg_id"] = newest["id"]
+                    self._save_state(room["id"])
+                    self._had_activity = True
+                pending.append((room, room_dir, state, messages, projects))
+
+            if pending:
+                # هر اتاق یک task؛ ترتیب ارسال داخل هر اتاق حفظ میشه
+                workers = max(1, min(self.chat_workers, len(pending)))
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='chat-reply') as pool:
+                    results = list(pool.map(lambda p: self._respond_room(*p), pending))
+                responded = sum(results)
+                # اتاقی که پاسخش ناموفق بود ثبت نمیشه و با backoff خودش دوباره بررسی میشه
+                for (room, _, state, *_), ok in zip(pending, results):
+                    if ok:
+                        self._room_recovered(room["id"], state)
+                        self._settle(settled, room)
+                    else:
+                        self._room_failed(room, state)
+        finally:
+            written = self.room_states.flush()
+            if written:
+                self._log("info", f"وضعیت {written} اتاق ذخیره شد")
+
+        self._save_room_index(settled)
+
+        self._log("info", f"بررسی تمام شد. {responded} پاسخ ارسال شد.")
+        return responded
 
-            guest = room.get("guest_name", "?")
-            self._log("info", f"اتاق {room_id} ({guest}): پیام جدید، تولید پاسخ...")
+    def _respond_room(self, room: dict, room_dir: Path, state: dict,
+                      messages: list, projects: list) -> bool:
+        room_id = room["id"]
+        newest = messages[0]
+        guest = room.get("guest_name", "?")
+        self._log("info", f"اتاق {room_id} ({guest}): پیام جدید، تولید پاسخ...")
 
+        try:
             project_ctx = self._get_project_context(projects)
-            proposal_ctx = self._get_proposal_context(projects)
-            conversation = self._format_conversation(messages)
 
             is_first_contact = not state.get("repo_name")
 
@@ -539,48 +2040,102 @@ class ChatManager:
                 receptor_id = room.get("user_id")
                 self._send_message(room_id, receptor_id, repo_name)
                 self._log("info", f"اتاق {room_id}: تگ ریپو ارسال شد: {repo_name}")
-                self._save_state(room_dir, state)
+                self._save_state(room_id)
                 time.sleep(1)
 
+            # ساخت ریپو متن کامل پروژه رو لازم داره؛ prompt پاسخ فقط نسخه‌ی محدودشده
+            reply_project, proposal_ctx, conversation = self._build_context(
+                room_id, state, messages, project_ctx, self._get_proposal_context(projects),
+            )
             response, approved = self._generate_response(
-                project_ctx, proposal_ctx, conversation
+                reply_project, proposal_ctx, conversation
             )
-            if not response:
-                self._log("warning", f"اتاق {room_id}: پاسخی تولید نشد")
-                continue
+        except Exception as e:
+            self._log("error", f"اتاق {room_id}: {e}")
+            return False
 
-            receptor_id = room.get("user_id")
-            if self._send_message(room_id, receptor_id, response):
-                self._log("success", f"اتاق {room_id} ({guest}): پاسخ ارسال شد")
-                state["last_responded_msg_id"] = newest["id"]
-
-                if approved:
-                    state["status"] = "approved"
-                    self._log("success", f"اتاق {room_id} ({guest}): تایید اولیه!")
-                    if self.tg:
-                        self.tg.send_message(
-                            f"<b>تایید اولیه!</b>\n"
-                            f"اتاق: {room_id}\nکارفرما: {guest}"
-                        )
-
-                self._save_state(room_dir, state)
-
-                log_file = room_dir / "conversation.txt"
-                with open(log_file, 'a', encoding='utf-8') as f:
-                    f.write(
-                        f"\n--- {datetime.now().isoformat()} ---\n"
-                        f"کارفرما: {newest.get('message', '')}\n"
-                        f"من: {response}\n"
-                    )
-
-                responded += 1
-                if responded < 10:
-                    time.sleep(3)
-            else:
-                self._log("error", f"اتاق {room_id}: ارسال ناموفق")
+        if not response:
+            self._log("warning", f"اتاق {room_id}: پاسخی تولید نشد")
+            return False
 
-        self._log("info", f"بررسی تمام شد. {responded} پاسخ ارسال شد.")
-        return responded
+        receptor_id = room.get("user_id")
+        if not self._send_message(room_id, receptor_id, response):
+            self._log("error", f"اتاق {room_id}: ارسال ناموفق")
+            return False
+
+        latency = self._record_latency(newest)
+        self._log("success", f"اتاق {room_id} ({guest}): پاسخ ارسال شد"
+                             + (f" (تاخیر پاسخ: {latency:.0f}s)" if latency is not None else ""))
+        state["last_responded_msg_id"] = newest["id"]
+
+        if approved:
+            state["status"] = "approved"
+            self._log("success", f"اتاق {room_id} ({guest}): تایید اولیه!")
+            if self.tg:
+                self.tg.send_message(
+                    f"<b>تایید اولیه!</b>\n"
+                    f"اتاق: {room_id}\nکارفرما: {html.escape(str(guest))}"
+                )
+
+        self._save_state(room_id)
+
+        # خطای دیسک نباید کل pool.map رو بترکونه؛ پاسخ ثبت شده و اتاق فقط backoff می‌خوره
+        try:
+            room_dir.mkdir(parents=True, exist_ok=True)
+            with open(room_dir / "conversation.txt", 'a', encoding='utf-8') as f:
+                f.write(
+                    f"\n--- {datetime.now().isoformat()} ---\n"
+                    f"کارفرما: {newest.get('message', '')}\n"
+                    f"من: {response}\n"
+                )
+        except OSError as e:
+            self._log("error", f"اتاق {room_id}: ذخیره گفتگو ناموفق: {e}")
+            return False
+        return True
+
+
+# ---------------------------------------------------------------------------
+# Relevance matcher (یک regex ترکیبی + یکسان‌سازی حروف فارسی/عربی)
+# ---------------------------------------------------------------------------
+
+FA_NORMALIZE = str.maketrans({'ي': 'ی', 'ى': 'ی', 'ك': 'ک', '\u200c': ' '})
+FA_VARIANTS = ('ي', 'ى', 'ك', '\u200c')
+
+
+def normalize_fa(text: str) -> str:
+    # translate کنده؛ فقط وقتی متن واقعاً حرف عربی یا نیم‌فاصله داره اجرا میشه
+    if any(ch in text for ch in FA_VARIANTS):
+        text = text.translate(FA_NORMALIZE)
+    return text.lower()
+
+
+class TermMatcher:
+
+    def __init__(self, terms):
+        self.terms = sorted({normalize_fa(t) for t in terms})
+        self.pattern = re.compile(self._trie_pattern(self.terms))
+
+    @classmethod
+    def _trie_pattern(cls, terms) -> str:
+        # regex درختی: پیشوندهای مشترک فقط یک بار بررسی میشن
+        trie = {}
+        for term in terms:
+            node = trie
+            for ch in term:
+                node = node.setdefault(ch, {})
+            node[''] = {}
+        return cls._trie_node(trie)
+
+    @classmethod
+    def _trie_node(cls, node: dict) -> str:
+        if '' in node:
+            # کوتاه‌ترین عبارت کافیه، چون فقط وجود تطبیق مهمه
+            return ''
+        alts = [re.escape(ch) + cls._trie_node(child) for ch, child in sorted(node.items())]
+        return alts[0] if len(alts) == 1 else '(?:' + '|'.join(alts) + ')'
+
+    def search(self, text: str) -> bool:
+        return self.pattern.search(normalize_fa(text)) is not None
 
 
 # ---------------------------------------------------------------------------
@@ -593,11 +2148,27 @@ class Karlancer:
     PROJECT_API = "https://www.karlancer.com/api/publics/projects"
     BIDS_API = "https://www.karlancer.com/api/bids"
 
-    def __init__(self, bearer_token: str, check_interval: int = 300, model: str = "sonnet", tg: TelegramLogger = None, github_token: str = ""):
+    # سقف پردازش‌های همزمان claude -p تا rate limit چند برابر نشه
+    MAX_ANALYSIS_WORKERS = 4
+
+    def __init__(self, bearer_token: str, check_interval: int = 300, model: str = "sonnet", tg: TelegramLogger = None, github_token: str = "",
+                 fetch_workers: int = 11, analysis_workers: int = 1, use_cache: bool = True,
+                 incremental: bool = False, search_mode: str = 'queries', state_backend: str = 'sqlite',
+                 chat_workers: int = 3, chat_interval: int = 15, bid_interval: int = 900,
+                 stats_interval: int = 1800):
         self.bearer_token = bearer_token
         self.check_interval = check_interval
         self.model = model
         self.tg = tg
+        self.fetch_workers = fetch_workers
+        self.bid_interval = bid_interval
+        self.stats_interval = stats_interval
+        self._iteration = 0
+        self.incremental = incremental
+        self.search_mode = search_mode
+        self.fetch_report = {}
+        self._report_lock = threading.Lock()
+        self.analysis_workers = max(1, min(analysis_workers, self.MAX_ANALYSIS_WORKERS))
 
         self.headers = {
             'accept': 'application/json, text/plain, */*',
@@ -620,10 +2191,11 @@ class Karlancer:
             'eloquent_viewable': 'lrRwPM0DaeQAEN9JRMwKyGaVoj5pQY78mXOnjDq7ebEX6BL1EbD3qrA4deZgW0xzlkPdGBZpmJL3g7Yy',
             '_ga': 'GA1.1.111872314.1781367982',
         }
+        # هدر و کوکی پیش‌فرض یک بار روی Session کارلنسر ست میشه
+        HTTP.configure(urlsplit(self.SEARCH_API).netloc, headers=self.headers, cookies=self.cookies)
 
         self.prompt_file = "karelancer_prompt.txt"
-        self.cache_file = "seen_projects.json"
-        self.tracking_file = "tracking.json"
+        self.prompt_versions = {}
         self.log_file = "karlancer.log"
         self.input_dir = Path("claude_input")
         self.output_dir = Path("proposals")
@@ -631,44 +2203,32 @@ class Karlancer:
         self.input_dir.mkdir(exist_ok=True)
         self.output_dir.mkdir(exist_ok=True)
 
-        self.seen_projects = self._load_json_set(self.cache_file)
-        self.tracking = self._load_tracking()
+        self.analysis_cache = AnalysisCache(enabled=use_cache)
+        self.state = open_state_store(state_backend)
+        self.seen_projects, self.tracking = self.state.load()
         self.bid_project_ids = set()
+        self._bid_lock = threading.Lock()
+        self._bid_meta = {}
+        self._bid_loaded = False
+        self._bids_synced = False
+        self._bids_refreshed_at = 0.0
+        self._bid_refresh_lock = threading.Lock()
+        self._bid_full_thread = None
+        self.query_marks = self.state.get_meta("query_marks", {})
+        self._pending_marks = {}
+        self.priorities = {}
+        self.relevance_file = "relevance.json"
+        self.relevance_config = self._load_relevance_config()
+        self.rule_hits = self.state.get_meta("rule_hits", {})
+        self._judged = {}
 
         self.chat_manager = ChatManager(
             headers=self.headers, submit_headers=self.submit_headers,
             cookies=self.cookies, model=self.model, tg=self.tg,
-            github_token=github_token,
+            github_token=github_token, chat_workers=chat_workers, state=self.state,
+            fast_interval=chat_interval, max_interval=check_interval,
         )
 
-    # -- persistence ---------------------------------------------------------
-
-    def _load_json_set(self, path: str) -> set:
-        try:
-            if Path(path).exists():
-                with open(path, 'r', encoding='utf-8') as f:
-                    return set(json.load(f))
-        except Exception:
-            pass
-        return set()
-
-    def _save_cache(self):
-        with open(self.cache_file, 'w', encoding='utf-8') as f:
-            json.dump(list(self.seen_projects), f, ensure_ascii=False, indent=2)
-
-    def _load_tracking(self) -> dict:
-        try:
-            if Path(self.tracking_file).exists():
-                with open(self.tracking_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-        except Exception:
-            pass
-        return {"total_fetched": 0, "total_analyzed": 0, "total_submitted": 0, "total_failed": 0, "projects": {}}
-
-    def _save_tracking(self):
-        with open(self.tracking_file, 'w', encoding='utf-8') as f:
-            json.dump(self.tracking, f, ensure_ascii=False, indent=2)
-
     # -- logging -------------------------------------------------------------
 
     def _log(self, icon: str, message: str, file=None):
@@ -690,92 +2250,297 @@ class Karlancer:
         'python', 'django', 'fastapi', 'ربات', 'تلگرام', 'bot',
         'backend', 'api', 'scraping', 'automation', 'اتوماسیون',
     ]
+    SEARCH_MODES = ('queries', 'feed')
+    FEED_KEY = '*feed*'
+    FEED_MAX_PAGES = 3
+    JUDGED_MAX = 5000
 
     # -- bid check -----------------------------------------------------------
 
-    def _fetch_bid_project_ids(self, full: bool = False) -> set:
+    BID_DELTA_MAX_PAGES = 3
+    BID_FULL_SYNC_INTERVAL = 24 * 3600
+    BID_SUBMIT_MAX_AGE = 60
+
+    def check_auth(self) -> bool:
+        try:
+            resp = HTTP.get(f"{self.BIDS_API}/?page=1", timeout=10)
+        except requests.RequestException as e:
+            self.log_warning(f"بررسی احراز هویت کارلنسر ناموفق: {e}")
+            return True
+        return resp.status_code not in (401, 403)
+
+    def _fetch_bid_page(self, page: int) -> tuple[list, int]:
+        resp = HTTP.get(f"{self.BIDS_API}/?page={page}", timeout=15)
+        resp.raise_for_status()
+        data = resp.json().get("data", {})
+        return data.get("data", []), data.get("last_page", 1)
+
+    def _fetch_bid_project_ids(self, full: bool = False, since: int = 0) -> tuple[set, int, bool]:
+        # در حالت delta با رسیدن به bid با id <= since (آخرین bid همگام‌شده) متوقف میشه؛
+        # خروجی سوم یعنی فاصله تا since کامل پوشش داده شده
         ids = set()
-        max_pages = 999 if full else 3
-        page = 1
-        while page <= max_pages:
-            try:
-                resp = requests.get(
-                    f"{self.BIDS_API}/?page={page}",
-                    headers=self.headers, cookies=self.cookies, timeout=15,
-                )
-                if resp.status_code != 200:
-                    break
-                data = resp.json().get("data", {})
-                bids = data.get("data", [])
-                if not bids:
-                    break
-                for bid in bids:
-                    pid = bid.get("project_id")
-                    if pid:
-                        ids.add(pid)
-                if page >= data.get("last_page", 1):
-                    break
-                page += 1
-            except Exception as e:
-                self.log_error(f"خطا در دریافت bidها (صفحه {page}): {e}")
-                break
-        return ids
+        newest_bid = 0
+        pager = Paginator(
+            self._fetch_bid_page,
+            max_pages=None if full else self.BID_DELTA_MAX_PAGES,
+            stop_when=(lambda bid: (bid.get("id") or 0) <= since) if since else None,
+            prefetch=full,
+            on_error=lambda page, e: self.log_error(f"خطا در دریافت bidها (صفحه {page}): {e}"),
+        )
+        for bid in pager:
+            newest_bid = max(newest_bid, bid.get("id") or 0)
+            pid = bid.get("project_id")
+            if pid:
+                ids.add(pid)
+        covered = pager.complete and pager.stopped in ('predicate', 'last_page', 'empty')
+        return ids, newest_bid, covered
+
+    def _load_bid_cache(self):
+        cache = self.state.get_meta("bid_cache", {})
+        with self._bid_lock:
+            self.bid_project_ids.update(cache.get("project_ids", []))
+            self._bid_meta = {k: v for k, v in cache.items() if k != "project_ids"}
+            self._bid_loaded = True
+        if cache:
+            self.log_info(
+                f"📋 {len(self.bid_project_ids)} bid از کش بارگذاری شد "
+                f"(آخرین همگام‌سازی: {cache.get('synced_at', '-')[:16]})"
+            )
 
-    def refresh_bid_cache(self):
-        if not self.bid_project_ids:
-            self.bid_project_ids = self._fetch_bid_project_ids(full=True)
-            self.log_info(f"📋 {len(self.bid_project_ids)} bid موجود بارگذاری شد (کامل)")
-        else:
-            new_ids = self._fetch_bid_project_ids(full=False)
+    def _save_bid_cache(self, **meta):
+        with self._bid_lock:
+            self._bid_meta.update(meta)
+            cache = {**self._bid_meta, "project_ids": sorted(self.bid_project_ids)}
+        self.state.set_meta("bid_cache", cache)
+
+    def refresh_bid_cache(self, max_age: float = None):
+        # job bidها و مرحله ارسال هم‌زمان صداش می‌زنن؛ با max_age اگه تازه باشه درخواستی نمیره
+        with self._bid_refresh_lock:
+            if max_age and self._bids_synced and time.monotonic() - self._bids_refreshed_at < max_age:
+                return
+            self._refresh_bid_cache()
+            if self._bids_synced:
+                self._bids_refreshed_at = time.monotonic()
+
+    def _refresh_bid_cache(self):
+        if not self._bid_loaded:
+            self._load_bid_cache()
+
+        # بدون یک همگام‌سازی کامل موفق، کش قابل اعتماد نیست؛ اجرای اول منتظرش می‌مونه
+        if not self._bid_meta.get("full_synced_at") or "newest_bid_id" not in self._bid_meta:
+            self._bids_synced = self._full_bid_sync()
+            return
+
+        since = self._bid_meta["newest_bid_id"]
+        new_ids, newest_bid, covered = self._fetch_bid_project_ids(full=False, since=since)
+        with self._bid_lock:
+            new_ids -= self.bid_project_ids
             self.bid_project_ids.update(new_ids)
-            self.log_info(f"📋 بروزرسانی bidها — مجموع: {len(self.bid_project_ids)}")
+        if not covered:
+            self.log_warning(f"📋 delta bidها به آخرین bid همگام‌شده ({since}) نرسید — همگام‌سازی کامل")
+            self._bids_synced = self._full_bid_sync()
+            return
+
+        self._bids_synced = True
+        self._save_bid_cache(synced_at=datetime.now().isoformat(), newest_bid_id=max(newest_bid, since))
+        self.log_info(f"📋 بروزرسانی bidها — {len(new_ids)} جدید، مجموع: {len(self.bid_project_ids)}")
+        self._maybe_start_full_bid_sync()
+
+    def _maybe_start_full_bid_sync(self):
+        last = self._bid_meta.get("full_synced_at")
+        if last:
+            try:
+                age = (datetime.now() - datetime.fromisoformat(last)).total_seconds()
+            except ValueError:
+                age = self.BID_FULL_SYNC_INTERVAL
+            if age < self.BID_FULL_SYNC_INTERVAL:
+                return
+        if self._bid_full_thread and self._bid_full_thread.is_alive():
+            return
+        self._bid_full_thread = threading.Thread(
+            target=self._full_bid_sync, name='bid-full-sync', daemon=True,
+        )
+        self._bid_full_thread.start()
+
+    def _full_bid_sync(self) -> bool:
+        start = time.monotonic()
+        self.log_info("📋 همگام‌سازی کامل bidها شروع شد")
+        ids, newest_bid, covered = self._fetch_bid_project_ids(full=True)
+        with self._bid_lock:
+            added = len(ids - self.bid_project_ids)
+            self.bid_project_ids.update(ids)
+        if not covered:
+            self.log_warning(f"📋 همگام‌سازی کامل bidها ناقص ماند — {added} bid اضافه شد")
+            return False
+        now = datetime.now().isoformat()
+        self._save_bid_cache(
+            synced_at=now, full_synced_at=now,
+            newest_bid_id=max(newest_bid, self._bid_meta.get("newest_bid_id", 0)),
+        )
+        self.log_info(
+            f"📋 همگام‌سازی کامل bidها تمام شد ({time.monotonic() - start:.0f}s) — "
+            f"{added} bid از قلم افتاده اضافه شد، مجموع: {len(self.bid_project_ids)}"
+        )
+        return True
 
     # -- fetch ---------------------------------------------------------------
 
-    def _fetch_page(self, query: str, page: int = 1) -> tuple[list, int]:
-        try:
-            params = {'order': 'newest', 'logged_in': '1', 'page': str(page)}
-            if query:
-                params['q'] = query
-            resp = requests.get(
-                self.SEARCH_API, headers=self.headers, cookies=self.cookies,
-                params=params, timeout=15,
-            )
-            resp.encoding = 'utf-8'
-            if resp.status_code == 200:
-                data = resp.json()
-                if data.get("status") == "success":
-                    page_data = data.get("data", {})
-                    return page_data.get("data", []), page_data.get("last_page", 1)
-        except Exception as e:
-            self.log_error(f"خطا در دریافت پروژه‌ها (q={query}, page={page}): {e}")
-        return [], 1
+    def _fetch_page(self, query: str, page: int = 1, strategy: str = 'queries') -> tuple[list, int]:
+        params = {'order': 'newest', 'logged_in': '1', 'page': str(page)}
+        if query:
+            params['q'] = query
+        resp = HTTP.get(self.SEARCH_API, params=params, timeout=15)
+        resp.encoding = 'utf-8'
+        self._count_fetch(strategy, requests=1, nbytes=len(resp.content))
+        resp.raise_for_status()
+        data = resp.json()
+        if data.get("status") != "success":
+            raise ValueError(f"status={data.get('status')}")
+        page_data = data.get("data")
+        if not isinstance(page_data, dict) or not isinstance(page_data.get("data"), list):
+            # پاسخ ناقص خطاست نه صفحه‌ی خالی، وگرنه فید «به‌روز» حساب میشه
+            raise ValueError("پاسخ بدون لیست پروژه")
+        return page_data["data"], page_data.get("last_page", 1)
+
+    def _search_pager(self, query: str, strategy: str, max_pages: int, mark: int) -> Paginator:
+        # فقط پروژه‌های جدیدتر از mark نگه داشته میشن؛ توقف وقتی کل صفحه قدیمی باشه،
+        # تا یک آیتم pin‌شده یا نامرتب بالای صفحه پروژه‌های جدید بعدش رو پنهان نکنه
+        newer = lambda p: (p.get('id') or 0) > mark
+        return Paginator(
+            lambda page: self._fetch_page(query, page=page, strategy=strategy),
+            max_pages=max_pages,
+            keep=newer if mark else None,
+            stop_page=(lambda items: not any(newer(p) for p in items)) if mark else None,
+            on_error=lambda page, e: self.log_error(f"خطا در دریافت پروژه‌ها (q={query}, page={page}): {e}"),
+        )
+
+    def _fetch_query(self, query: str) -> tuple[str, list, float, int]:
+        start = time.monotonic()
+        mark = self.query_marks.get(query, 0) if self.incremental else 0
+        pager = self._search_pager(query, 'queries', max_pages=2, mark=mark)
+        projects = list(pager)
+        if not pager.complete:
+            # یک صفحه نرسید → mark قبلی می‌مونه تا چرخه‌ی بعد همون صفحه دوباره خونده بشه
+            return query, projects, time.monotonic() - start, mark
+        newest = max((p.get('id') or 0 for p in projects), default=0)
+        return query, projects, time.monotonic() - start, max(newest, mark)
 
     def fetch_projects(self) -> list:
+        if self.search_mode != 'feed':
+            return self._fetch_by_queries()
+
+        projects, caught_up = self._fetch_feed()
+        if caught_up:
+            return projects
+        # پروژه‌های همین فید هم با نتایج کوئری‌ها ادغام میشن
+        merged = {p['id']: p for p in self._fetch_by_queries()}
+        for p in projects:
+            merged.setdefault(p['id'], p)
+        return sorted(merged.values(), key=lambda p: p.get('id', 0), reverse=True)
+
+    def _fetch_feed(self) -> tuple[list, bool]:
+        # فید بدون فیلتر؛ فیلتر مرتبط بودن بعداً محلی (_is_relevant) اعمال میشه
+        start = time.monotonic()
+        mark = self.query_marks.get(self.FEED_KEY, 0)
+        pager = self._search_pager('', 'feed', max_pages=self.FEED_MAX_PAGES, mark=mark)
+        projects = [p for p in pager if p.get('id')]
+        # صفحه‌ی خطادار یعنی ممکنه پروژه‌ای جا مونده باشه → نه caught_up و نه جلو بردن mark
+        caught_up = pager.complete and (
+            pager.stopped in ('predicate', 'last_page') or (pager.stopped == 'empty' and bool(mark))
+        )
+
+        newest = max((p.get('id') or 0 for p in projects), default=0)
+        if pager.complete:
+            self._pending_marks[self.FEED_KEY] = max(newest, mark)
+        self._count_fetch('feed', cycles=1)
+
+        if not caught_up:
+            # بدون mark، خطای صفحه یا فید سریع‌تر از یک بازه جلو رفته؛ پوشش کامل با کوئری‌ها
+            if not pager.complete:
+                reason = f"خطا در صفحه {', '.join(map(str, pager.failed_pages)) or 1}"
+            elif not mark:
+                reason = "اولین اجرا"
+            else:
+                reason = f"بیش از {self.FEED_MAX_PAGES} صفحه پروژه جدید"
+            self.log_warning(f"📶 فید عقب افتاد ({reason}) — برگشت به کوئری‌های کلیدی")
+            self._count_fetch('feed', fallbacks=1)
+
+        projects.sort(key=lambda p: p.get('id', 0), reverse=True)
+        self._count_fetch('feed', projects=len(projects))
+        if caught_up:
+            self.log_info(f"📶 فید: {len(projects)} پروژه جدید ({time.monotonic() - start:.1f}s)")
+            self._log_fetch_report()
+        return projects, caught_up
+
+    def _count_fetch(self, strategy: str, **counts):
+        with self._report_lock:
+            report = self.fetch_report.setdefault(strategy, {
+                "cycles": 0, "requests": 0, "nbytes": 0, "projects": 0, "fallbacks": 0,
+            })
+            for name, value in counts.items():
+                report[name] += value
+
+    def _log_fetch_report(self):
+        with self._report_lock:
+            report = {k: dict(v) for k, v in self.fetch_report.items()}
+        parts = []
+        for strategy, r in report.items():
+            cycles = max(1, r["cycles"])
+            part = (
+                f"{strategy}: {r['requests'] / cycles:.1f} درخواست و "
+                f"{r['nbytes'] / cycles / 1024:.0f}KB در هر چرخه، "
+                f"{r['projects'] / cycles:.1f} پروژه"
+            )
+            if r["fallbacks"]:
+                part += f"، {r['fallbacks']} fallback"
+            parts.append(part)
+        if parts:
+            self.log_info("📶 مقایسه استراتژی‌ها — " + " | ".join(parts))
+
+    def _fetch_by_queries(self) -> list:
         seen_ids = set()
         all_projects = []
 
-        for query in self.SEARCH_QUERIES:
-            projects, last_page = self._fetch_page(query, page=1)
+        start = time.monotonic()
+        workers = max(1, min(self.fetch_workers, len(self.SEARCH_QUERIES)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fetch') as pool:
+            # map ترتیب کوئری‌ها رو حفظ می‌کنه، پس ادغام قطعیه
+            results = list(pool.map(self._fetch_query, self.SEARCH_QUERIES))
+
+        timings = []
+        unchanged = 0
+        for query, projects, elapsed, newest in results:
+            timings.append(f"{query}={elapsed:.1f}s")
+            if self.incremental:
+                if newest and newest == self.query_marks.get(query) and not projects:
+                    unchanged += 1
+                self._pending_marks[query] = newest
             for p in projects:
                 pid = p.get('id')
                 if pid and pid not in seen_ids:
                     seen_ids.add(pid)
                     all_projects.append(p)
 
-            # صفحه ۲ هم بگیر اگه وجود داره
-            if last_page >= 2:
-                projects2, _ = self._fetch_page(query, page=2)
-                for p in projects2:
-                    pid = p.get('id')
-                    if pid and pid not in seen_ids:
-                        seen_ids.add(pid)
-                        all_projects.append(p)
-
         all_projects.sort(key=lambda p: p.get('id', 0), reverse=True)
-        self.log_info(f"مجموع {len(all_projects)} پروژه یکتا از {len(self.SEARCH_QUERIES)} کوئری دریافت شد")
+        self._count_fetch('queries', cycles=1, projects=len(all_projects))
+        self.log_info(
+            f"مجموع {len(all_projects)} پروژه یکتا از {len(self.SEARCH_QUERIES)} کوئری دریافت شد "
+            f"({time.monotonic() - start:.1f}s، {workers} worker)"
+        )
+        self.log_info(f"⏱️  زمان کوئری‌ها: {', '.join(timings)}")
+        if unchanged:
+            self.log_info(f"⏭️  {unchanged} کوئری بدون پروژه جدید رد شد")
+        self._log_fetch_report()
         return all_projects
 
+    def _commit_query_marks(self):
+        # بعد از پردازش کامل چرخه ذخیره میشه تا crash وسط کار پروژه‌ای رو گم نکنه
+        if not self._pending_marks:
+            return
+        self.query_marks.update(self._pending_marks)
+        self._pending_marks = {}
+        self.state.set_meta("query_marks", self.query_marks)
+
     # -- save project --------------------------------------------------------
 
     def save_project(self, project: dict) -> Path | None:
@@ -812,14 +2577,21 @@ class Karlancer:
             self.log_error(f"فایل پروژه {project_id} یافت نشد")
             return None
 
-        prompt_path = Path(self.prompt_file)
-        if not prompt_path.exists():
+        template = PROMPTS.get(self.prompt_file)
+        if not template:
             self.log_error("فایل prompt یافت نشد")
             return None
 
-        system_prompt = prompt_path.read_text(encoding='utf-8')
+        system_prompt, prompt_version = template
+        self.prompt_versions[project_id] = prompt_version
         project_text = project_file.read_text(encoding='utf-8')
 
+        cache_key = self.analysis_cache.key(self.model, system_prompt, project_text)
+        cached = self.analysis_cache.get(cache_key)
+        if cached:
+            self.log_success(f"تحلیل پروژه {project_id} از کش خونده شد ({cache_key[:12]})")
+            return self._write_analysis(project_id, cached, prompt_version)
+
         combined = f"{system_prompt}\n\n{'=' * 80}\n\nاین پروژه جدید از کارلنسر اومده:\n\n{project_text}"
 
         self.log_info(f"تحلیل پروژه {project_id} با Claude ({self.model})...")
@@ -834,15 +2606,9 @@ class Karlancer:
             )
 
             if len(clean_output) > 200:
-                output_file = self.output_dir / f"project_{project_id}_analysis.txt"
-                output_file.write_text(
-                    f"Project ID: {project_id}\n"
-                    f"تاریخ: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                    f"{'=' * 80}\n\n{clean_output}\n",
-                    encoding='utf-8',
-                )
+                self.analysis_cache.put(cache_key, clean_output)
                 self.log_success(f"تحلیل پروژه {project_id} موفق ({len(clean_output)} chars)")
-                return output_file
+                return self._write_analysis(project_id, clean_output, prompt_version)
             else:
                 self.log_warning(f"خروجی تحلیل پروژه {project_id} کوتاه است")
         else:
@@ -850,6 +2616,17 @@ class Karlancer:
 
         return None
 
+    def _write_analysis(self, project_id: int, clean_output: str, prompt_version: str = "") -> Path:
+        output_file = self.output_dir / f"project_{project_id}_analysis.txt"
+        output_file.write_text(
+            f"Project ID: {project_id}\n"
+            f"تاریخ: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+            f"Prompt: {prompt_version}\n"
+            f"{'=' * 80}\n\n{clean_output}\n",
+            encoding='utf-8',
+        )
+        return output_file
+
     # -- extract proposal ----------------------------------------------------
 
     def extract_proposal(self, analysis_file: Path) -> str | None:
@@ -906,6 +2683,24 @@ class Karlancer:
 
     # -- submit --------------------------------------------------------------
 
+    def _index_project_context(self, project_id: int, project: dict, proposal: str):
+        # متن پروژه و پروپوزال ارسال‌شده یک بار ذخیره میشن تا چت دیگه فایل تحلیل رو parse نکنه
+        project_file = self.input_dir / f"project_{project_id}.txt"
+        try:
+            summary = project_file.read_text(encoding='utf-8')
+        except OSError:
+            summary = f"عنوان: {project.get('title', '')}"
+        try:
+            self.state.put_context(project_id, {
+                "title": project.get('title', ''),
+                "summary": summary,
+                "proposal": proposal,
+                "prompt_version": self.prompt_versions.get(project_id),
+                "submitted_at": datetime.now().isoformat(),
+            })
+        except Exception as e:
+            self.log_warning(f"ذخیره context پروژه {project_id} ناموفق: {e}")
+
     def submit_proposal(self, project_id: int, project: dict, analysis_file: Path) -> bool:
         # چک کن قبلا bid فرستادی یا نه
         if project_id in self.bid_project_ids:
@@ -921,8 +2716,7 @@ class Karlancer:
         title = project.get('title', '').lower()
         desc = project.get('description', '').lower()
         min_budget = project.get('min_budget', 0)
-        bad_techs = ['wordpress', 'wp', 'woocommerce', 'shopify', 'php']
-        is_low_quality = min_budget < 1_000_000 or any(t in title or t in desc for t in bad_techs)
+        is_low_quality = min_budget < self.relevance_config["budget_floor"] or any(t in title or t in desc for t in self.BAD_TECHS)
 
         if is_low_quality:
             self.log_warning(f"پروژه {project_id} بی‌کیفیت - تغییر سلام به SALAM")
@@ -959,9 +2753,10 @@ class Karlancer:
         }
 
         try:
-            resp = requests.post(self.BIDS_API, headers=self.submit_headers, cookies=self.cookies, json=payload, timeout=10)
+            resp = HTTP.post(self.BIDS_API, headers=self.submit_headers, json=payload, timeout=10)
             if resp.status_code in [200, 201]:
                 self.log_success(f"پروژه {project_id} با موفقیت ارسال شد!")
+                self._index_project_context(project_id, project, proposal)
                 return True
             elif resp.status_code == 409:
                 self.log_warning(f"پروژه {project_id} قبلاً پیشنهاد ثبت شده — رد شد")
@@ -1011,6 +2806,30 @@ class Karlancer:
         'crm', 'مدیریت ارتباط با مشتری',
     }
 
+    BAD_TECHS = ['wordpress', 'wp', 'woocommerce', 'shopify', 'php', 'وردپرس', 'ووکامرس', 'پی اچ پی']
+    CORE_STACK = ['python', 'پایتون', 'django', 'fastapi', 'flask', 'ربات', 'bot', 'scraping', 'اسکریپینگ', 'api']
+
+    TECH_MATCHER = TermMatcher(TECH_SKILLS)
+    SKIP_MATCHER = TermMatcher(SKIP_KEYWORDS)
+    BAD_TECH_MATCHER = TermMatcher(BAD_TECHS)
+    CORE_MATCHER = TermMatcher(CORE_STACK)
+
+    # وزن قوانین؛ با relevance.json قابل override هست
+    RELEVANCE_CONFIG = {
+        "threshold": 0,
+        "budget_floor": 1_000_000,
+        "weights": {
+            "tech_skill": 2,
+            "core_stack": 2,
+            "no_tech_skill": -10,
+            "skip_keyword": -10,
+            # همون شرط‌های is_low_quality در submit_proposal؛ پروژه‌ای که SALAM میشه تحلیل نمیشه
+            "bad_tech": -10,
+            "low_budget": -10,
+        },
+    }
+    relevance_config = RELEVANCE_CONFIG
+
     FA_DIGITS = str.maketrans('۰۱۲۳۴۵۶۷۸۹', '0123456789')
 
     def _is_too_old(self, project: dict) -> bool:
@@ -1023,106 +2842,279 @@ class Karlancer:
             return True
         return False
 
-    def _is_relevant(self, project: dict) -> bool:
+    # -- priority ------------------------------------------------------------
+
+    AGE_UNITS = {'ثانیه': 0, 'دقیقه': 1, 'ساعت': 60, 'روز': 1440, 'هفته': 10080, 'ماه': 43200, 'سال': 525600}
+    PRIORITY_BUDGET_CAP = 50_000_000
+    PRIORITY_MAX_AGE = 5 * 1440
+
+    def _age_minutes(self, project: dict) -> int | None:
+        past = (project.get('past_time') or '').translate(self.FA_DIGITS)
+        m = re.search(r'(\d+)\s*(ثانیه|دقیقه|ساعت|روز|هفته|ماه|سال)', past)
+        if m:
+            return int(m.group(1)) * self.AGE_UNITS[m.group(2)]
+        if 'لحظاتی' in past or 'همین الان' in past:
+            return 0
+        return None
+
+    def _priority_score(self, project: dict) -> float:
+        # بودجه (۴۰) + تازگی (۲۵) + همپوشانی مهارت (۲۵) + امتیاز کارفرما (۱۰)
+        budget = max(project.get('max_budget') or 0, project.get('min_budget') or 0)
+        budget_score = 40 * min(1.0, math.log1p(budget / 1_000_000) / math.log1p(self.PRIORITY_BUDGET_CAP / 1_000_000))
+
+        age = self._age_minutes(project)
+        fresh_score = 12.5 if age is None else 25 * max(0.0, 1 - age / self.PRIORITY_MAX_AGE)
+
+        skill_names = {(s.get('name') or '').lower() for s in project.get('skills') or []}
+        overlap = sum(1 for name in skill_names if self.TECH_MATCHER.search(name))
+        skill_score = 25 * min(1.0, overlap / 3)
+
+        try:
+            rate = float(project.get('rate') or 0)
+        except (TypeError, ValueError):
+            rate = 0.0
+        rate_score = 10 * min(1.0, max(0.0, rate) / 5)
+
+        return round(budget_score + fresh_score + skill_score + rate_score, 1)
+
+    def _prioritize(self, projects: list) -> list:
+        heap = []
+        for project in projects:
+            score = self._priority_score(project)
+            self.priorities[project['id']] = score
+            heapq.heappush(heap, (-score, -project['id'], len(heap), project))
+        ordered = [heapq.heappop(heap)[3] for _ in range(len(heap))]
+        self.log_info("🎯 ترتیب اولویت: " + ", ".join(
+            f"{p['id']}({self.priorities[p['id']]})" for p in ordered
+        ))
+        return ordered
+
+    def _load_relevance_config(self) -> dict:
+        config = json.loads(json.dumps(self.RELEVANCE_CONFIG))
+        path = Path(self.relevance_file)
+        if path.exists():
+            try:
+                override = json.loads(path.read_text(encoding='utf-8'))
+                config["weights"].update(override.pop("weights", {}))
+                config.update(override)
+            except Exception as e:
+                self.log_error(f"خطا در خواندن {self.relevance_file}: {e}")
+        return config
+
+    def _relevance(self, project: dict) -> tuple[float, list]:
         if self._is_too_old(project):
-            return False
+            return float('-inf'), ["too_old"]
 
+        weights = self.relevance_config["weights"]
+        hits = []
+        title = project.get('title', '')
+        desc = project.get('description', '')
         skills = project.get('skills', [])
+        skill_text = '\n'.join(s.get('name') or '' for s in skills)
+
         if skills:
-            skill_names = {s.get('name', '').lower() for s in skills}
-            has_tech = any(ts in name for name in skill_names for ts in self.TECH_SKILLS)
-            if has_tech:
-                return True
-            return False
+            tech = sum(1 for s in skills if self.TECH_MATCHER.search(s.get('name') or ''))
+            if tech:
+                hits.extend(["tech_skill"] * min(tech, 3))
+            else:
+                hits.append("no_tech_skill")
+        elif self.SKIP_MATCHER.search(f"{title} {desc}"):
+            hits.append("skip_keyword")
 
-        title = project.get('title', '')
-        desc = project.get('description', '')
-        text = f"{title} {desc}"
-        if any(kw in text for kw in self.SKIP_KEYWORDS):
-            return False
+        if self.CORE_MATCHER.search(f"{title}\n{skill_text}"):
+            hits.append("core_stack")
+        if self.BAD_TECH_MATCHER.search(f"{title}\n{desc}\n{skill_text}"):
+            hits.append("bad_tech")
+        if (project.get('min_budget') or 0) < self.relevance_config["budget_floor"]:
+            hits.append("low_budget")
 
-        return True
+        return sum(weights.get(rule, 0) for rule in hits), hits
+
+    def _is_relevant(self, project: dict) -> bool:
+        score, _ = self._relevance(project)
+        return score >= self.relevance_config["threshold"]
+
+    def filter_relevant(self, projects: list) -> list:
+        kept = []
+        rejected = Counter()
+        for p in projects:
+            score, hits = self._relevance(p)
+            relevant = score >= self.relevance_config["threshold"]
+            if relevant:
+                kept.append(p)
+            # هر پروژه فقط بار اولی که دیده میشه در آمار قوانین شمرده میشه
+            if p.get('id') in self._judged:
+                continue
+            # dict به‌عنوان set مرتب؛ قدیمی‌ترین‌ها (که دیگه در جستجو نمیان) اول حذف میشن
+            self._judged[p.get('id')] = None
+            if len(self._judged) > self.JUDGED_MAX:
+                del self._judged[next(iter(self._judged))]
+            for rule in set(hits):
+                stat = self.rule_hits.setdefault(rule, {"hits": 0, "rejects": 0})
+                stat["hits"] += 1
+                if not relevant and self.relevance_config["weights"].get(rule, -1) < 0:
+                    stat["rejects"] += 1
+                    rejected[rule] += 1
+        if rejected:
+            self.log_info("🚫 رد توسط قوانین: " + ", ".join(f"{r}={n}" for r, n in rejected.most_common()))
+            self.state.set_meta("rule_hits", self.rule_hits)
+        return kept
 
     # -- process -------------------------------------------------------------
 
-    def process_new_projects(self):
+    def process_new_projects(self, refresh_bids: bool = True):
         self.log_info("جستجوی پروژه‌های جدید...")
-        self.refresh_bid_cache()
+        if refresh_bids or not self._bids_synced:
+            self.refresh_bid_cache()
+        if not self._bids_synced:
+            # بدون لیست کامل bidها ممکنه برای پروژه‌ای دوباره پروپوزال بره؛ این چرخه رد میشه
+            self.log_warning("📋 لیست bidها کامل نیست — ارسال پروپوزال تا همگام‌سازی بعدی متوقف شد")
+            return
 
         all_projects = self.fetch_projects()
         if not all_projects:
             self.log_info("هیچ پروژه‌ای دریافت نشد")
+            self._commit_query_marks()
             return
 
-        new_projects = [
+        new_projects = self.filter_relevant([
             p for p in all_projects
             if p.get('id') and p['id'] not in self.seen_projects
             and p['id'] not in self.bid_project_ids
-            and self._is_relevant(p)
-        ]
+        ])
         if not new_projects:
             self.log_info(f"تمام {len(all_projects)} پروژه قبلاً دیده شده‌اند")
+            self._commit_query_marks()
             return
 
         self.log_success(f"🆕 {len(new_projects)} پروژه جدید پیدا شد!")
+        new_projects = self._prioritize(new_projects)
 
         if self.tg:
             self.tg.send_new_projects(len(new_projects))
 
-        for idx, project in enumerate(new_projects, 1):
-            project_id = project['id']
-            title = project.get('title', 'بدون عنوان')
+        if self.analysis_workers > 1 and len(new_projects) > 1:
+            self._process_pipelined(new_projects)
+        else:
+            for idx, project in enumerate(new_projects, 1):
+                print("\n" + "=" * 80)
+                self.log_info(f"[{idx}/{len(new_projects)}] پروژه {project['id']}: {project.get('title', 'بدون عنوان')}")
+                print("=" * 80)
 
-            print("\n" + "=" * 80)
-            self.log_info(f"[{idx}/{len(new_projects)}] پروژه {project_id}: {title}")
-            print("=" * 80)
+                analysis_file, error = self._analyze_stage(project)
+                self._submit_stage(project, analysis_file, error)
 
-            saved = self.save_project(project)
-            if not saved:
-                self.tracking["total_failed"] += 1
-                self._persist(project_id)
-                continue
+                if idx < len(new_projects):
+                    time.sleep(2)
 
-            analysis_file = self.analyze_project(project_id)
-            if not analysis_file:
-                self.tracking["total_failed"] += 1
-                self.tracking["projects"][str(project_id)] = {
-                    "title": title, "fetched_at": datetime.now().isoformat(),
-                    "analyzed": False, "submitted": False, "error": "Analysis failed",
-                }
-                self._persist(project_id)
-                continue
+        self._commit_query_marks()
 
-            self.tracking["total_analyzed"] += 1
+        print("\n" + "=" * 80)
+        self.log_success(f"پردازش {len(new_projects)} پروژه تمام شد")
+        self._print_stats()
+        print("=" * 80 + "\n")
 
-            submitted = self.submit_proposal(project_id, project, analysis_file)
-            if submitted:
-                self.tracking["total_submitted"] += 1
-                if self.tg:
-                    self.tg.send_project_submitted(project_id, title)
-            else:
-                self.tracking["total_failed"] += 1
+    def _process_pipelined(self, new_projects: list):
+        workers = min(self.analysis_workers, len(new_projects))
+        self.log_info(f"🧵 تحلیل موازی {len(new_projects)} پروژه با {workers} worker")
+
+        def analyze(idx, project):
+            self.log_info(f"[{idx}/{len(new_projects)}] شروع تحلیل پروژه {project['id']}: {project.get('title', 'بدون عنوان')}")
+            return self._analyze_stage(project)
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='analyze') as pool:
+            futures = [
+                (pool.submit(analyze, idx, project), project)
+                for idx, project in enumerate(new_projects, 1)
+            ]
+            # تحلیل‌ها موازی‌ان ولی ارسال فقط از همین thread و به ترتیب اولویت انجام میشه؛
+            # پروژه‌ی پراولویت منتظر تحلیل کندتر پروژه‌های بعدی نمی‌مونه چون اول صف submit شده
+            for future, project in futures:
+                try:
+                    analysis_file, error = future.result()
+                except Exception as e:
+                    self.log_error(f"خطا در تحلیل پروژه {project['id']}: {e}")
+                    analysis_file, error = None, "Analysis failed"
+                self._submit_stage(project, analysis_file, error)
+
+    def _analyze_stage(self, project: dict) -> tuple[Path | None, str | None]:
+        saved = self.save_project(project)
+        if not saved:
+            return None, "Save failed"
+        analysis_file = self.analyze_project(project['id'])
+        if not analysis_file:
+            return None, "Analysis failed"
+        return analysis_file, None
+
+    def _submit_stage(self, project: dict, analysis_file: Path | None, error: str | None):
+        project_id = project['id']
+        title = project.get('title', 'بدون عنوان')
 
+        if error == "Save failed":
+            self.tracking["total_failed"] += 1
+            self._persist(project_id)
+            return
+
+        if not analysis_file:
+            self.tracking["total_failed"] += 1
             self.tracking["projects"][str(project_id)] = {
                 "title": title, "fetched_at": datetime.now().isoformat(),
-                "analyzed": True, "submitted": submitted,
-                "analysis_file": str(analysis_file),
+                "analyzed": False, "submitted": False, "error": error or "Analysis failed",
+                "prompt_version": self.prompt_versions.pop(project_id, None),
+                "priority": self.priorities.get(project_id),
             }
             self._persist(project_id)
+            return
 
-            if idx < len(new_projects):
-                time.sleep(2)
+        # تحلیل ممکنه چند دقیقه طول کشیده باشه؛ bidها درست قبل از ارسال تازه میشن
+        self.refresh_bid_cache(max_age=self.BID_SUBMIT_MAX_AGE)
+        if not self._bids_synced:
+            # پروژه دیده‌نشده می‌مونه و markهای این چرخه دور ریخته میشن تا چرخه بعد دوباره بیاد
+            self.log_warning(f"پروژه {project_id}: لیست bidها کامل نیست — ارسال به چرخه بعد موکول شد")
+            self.priorities.pop(project_id, None)
+            self.prompt_versions.pop(project_id, None)
+            self._pending_marks = {}
+            return
 
-        print("\n" + "=" * 80)
-        self.log_success(f"پردازش {len(new_projects)} پروژه تمام شد")
-        self._print_stats()
-        print("=" * 80 + "\n")
+        self.tracking["total_analyzed"] += 1
+
+        submitted = self.submit_proposal(project_id, project, analysis_file)
+        if submitted:
+            self.tracking["total_submitted"] += 1
+            if self.tg:
+                self.tg.send_project_submitted(project_id, title)
+        else:
+            self.tracking["total_failed"] += 1
+
+        self.tracking["projects"][str(project_id)] = {
+            "title": title, "fetched_at": datetime.now().isoformat(),
+            "analyzed": True, "submitted": submitted,
+            "analysis_file": str(analysis_file),
+            "prompt_version": self.prompt_versions.pop(project_id, None),
+            "priority": self.priorities.get(project_id),
+        }
+        self._persist(project_id)
 
     def _persist(self, project_id: int):
+        self.priorities.pop(project_id, None)
         self.seen_projects.add(project_id)
         self.tracking["total_fetched"] += 1
-        self._save_cache()
-        self._save_tracking()
+        self.state.persist_project(project_id)
+
+    def _search_job(self):
+        self._iteration += 1
+        self.log_info(f"🔄 چرخه #{self._iteration} - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        # bidها job جدا دارن؛ اینجا فقط بار اول بارگذاری میشن
+        self.process_new_projects(refresh_bids=False)
+
+    def _flush_stats(self, scheduler: Scheduler = None):
+        written = self.chat_manager.room_states.flush()
+        if written:
+            self.log_info(f"💾 وضعیت {written} اتاق ذخیره شد")
+        self._print_stats()
+        if scheduler:
+            for line in scheduler.metrics():
+                self.log_info(f"⏱️  {line}")
 
     def _print_stats(self):
         t = self.tracking
@@ -1132,6 +3124,32 @@ class Karlancer:
             f"{t['total_submitted']} ارسال، "
             f"{t['total_failed']} خطا"
         )
+        for host, st in HTTP.stats().items():
+            self.log_info(
+                f"🔌 {host}: {st['requests']} درخواست، "
+                f"{st['connections']} اتصال جدید، {st['reused']} استفاده مجدد"
+            )
+        versions = PROMPTS.versions()
+        if versions:
+            self.log_info("📝 نسخه promptها: " + ", ".join(f"{p}={v}" for p, v in versions.items())
+                          + (f" ({PROMPTS.reloads} بارگذاری مجدد)" if PROMPTS.reloads else ""))
+        if self.analysis_cache.hits or self.analysis_cache.misses:
+            self.log_info(f"🗃️  کش تحلیل: {self.analysis_cache.hits} hit، {self.analysis_cache.misses} miss")
+        if self.rule_hits:
+            self.log_info("🚦 قوانین فیلتر (hit/رد): " + ", ".join(
+                f"{rule}={st['hits']}/{st['rejects']}" for rule, st in sorted(self.rule_hits.items())
+            ))
+        latency = self.chat_manager.latency_summary()
+        if latency:
+            self.log_info(f"💬 {latency}")
+        if self.tg:
+            self.log_info(f"📱 تلگرام: {self.tg.sent} ارسال، {self.tg.failed} ناموفق، "
+                          f"{self.tg.dropped} حذف از صف، {self.tg.queued} در صف")
+        cs = CLAUDE.stats()
+        self.log_info(
+            f"🧠 Claude: {cs['calls']} فراخوانی، {cs['rate_limited']} rate limit، "
+            f"انتظار صف avg={cs['wait_avg']:.1f}s p90={cs['wait_p90']:.1f}s max={cs['wait_max']:.1f}s"
+        )
 
     # -- single project ------------------------------------------------------
 
@@ -1145,12 +3163,12 @@ class Karlancer:
         slug = self._resolve_project_slug(raw_id)
         self.log_info(f"پردازش تکی پروژه {slug}...")
         self.refresh_bid_cache()
+        if not self._bids_synced:
+            self.log_error("لیست bidها کامل نیست — برای جلوگیری از ارسال تکراری متوقف شد")
+            return
 
         try:
-            resp = requests.get(
-                f"{self.PROJECT_API}/{slug}",
-                headers=self.headers, cookies=self.cookies, timeout=15,
-            )
+            resp = HTTP.get(f"{self.PROJECT_API}/{slug}", timeout=15)
             resp.encoding = 'utf-8'
             if resp.status_code != 200:
                 self.log_error(f"دریافت پروژه ناموفق: HTTP {resp.status_code}")
@@ -1174,10 +3192,14 @@ class Karlancer:
         if not analysis_file:
             return
 
+        self.refresh_bid_cache(max_age=self.BID_SUBMIT_MAX_AGE)
+        if not self._bids_synced:
+            self.log_error("لیست bidها کامل نیست — برای جلوگیری از ارسال تکراری متوقف شد")
+            return
+
         submitted = self.submit_proposal(project_id, project, analysis_file)
         if submitted:
-            self.seen_projects.add(project_id)
-            self._save_cache()
+            self.state.add_seen(project_id)
             if self.tg:
                 self.tg.send_project_submitted(project_id, title)
         print("=" * 80)
@@ -1194,6 +3216,7 @@ class Karlancer:
             self.log_info("📱 Telegram Logger: فعال")
             self.tg.send_startup(self.check_interval)
         print("=" * 80 + "\n")
+        STARTUP.done("loop", "شروع اولین چرخه")
 
         if once:
             if not chat_only:
@@ -1201,35 +3224,87 @@ class Karlancer:
             self.chat_manager.check_and_respond()
             return
 
-        iteration = 0
-        try:
-            while True:
-                iteration += 1
-                self.log_info(f"🔄 چرخه #{iteration} - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-
-                if not chat_only:
-                    try:
-                        self.process_new_projects()
-                    except Exception as e:
-                        self.log_error(f"خطا در پردازش پروژه‌ها: {e}")
-
-                try:
-                    self.chat_manager.check_and_respond()
-                except Exception as e:
-                    self.log_error(f"خطا در پردازش چت‌ها: {e}")
-
-                self.log_info(f"😴 استراحت {self.check_interval} ثانیه تا چرخه بعدی...")
-                time.sleep(self.check_interval)
+        # هر کار زمان‌بندی مستقل خودش رو داره و کند بودن یکی بقیه رو عقب نمی‌اندازه
+        scheduler = Scheduler(log_fn=self.log_error)
+        if not chat_only:
+            scheduler.add(PeriodicJob("search", self._search_job, self.check_interval,
+                                      jitter=self.check_interval * 0.1))
+            scheduler.add(PeriodicJob("bids", self.refresh_bid_cache, self.bid_interval,
+                                      jitter=30, delay=self.bid_interval))
+        scheduler.add(PeriodicJob("chat", self.chat_manager.poll, self.chat_manager.fast_interval,
+                                  jitter=2, adaptive=True))
+        scheduler.add(PeriodicJob("stats", lambda: self._flush_stats(scheduler), self.stats_interval,
+                                  delay=self.stats_interval))
 
+        try:
+            scheduler.run_forever()
         except KeyboardInterrupt:
+            scheduler.stop()
             print("\n")
             self.log_warning("⛔ متوقف شد توسط کاربر (Ctrl+C)")
-            self._print_stats()
+            if not scheduler.wait_idle({"chat"}, timeout=30):
+                self.log_warning("job چت هنوز در حال اجراست — وضعیت فعلی اتاق‌ها ذخیره میشه")
+            self._flush_stats(scheduler)
             if self.tg:
                 self.tg.send_shutdown(self.tracking)
             self.log_success("👋 خداحافظ!")
 
 
+# ---------------------------------------------------------------------------
+# Relevance benchmark
+# ---------------------------------------------------------------------------
+
+def benchmark_relevance(rounds: int = 200):
+    # پیاده‌سازی قبلی (اسکن تودرتوی substring) برای مقایسه
+    def legacy(bot, project):
+        if bot._is_too_old(project):
+            return False
+        skills = project.get('skills', [])
+        if skills:
+            skill_names = {s.get('name', '').lower() for s in skills}
+            return any(ts in name for name in skill_names for ts in bot.TECH_SKILLS)
+        text = f"{project.get('title', '')} {project.get('description', '')}"
+        return not any(kw in text for kw in bot.SKIP_KEYWORDS)
+
+    # همان منطق بولی قدیمی، با matcherهای کامپایل‌شده
+    def compiled(bot, project):
+        if bot._is_too_old(project):
+            return False
+        skills = project.get('skills', [])
+        if skills:
+            return bot.TECH_MATCHER.search('\n'.join(s.get('name') or '' for s in skills))
+        return not bot.SKIP_MATCHER.search(f"{project.get('title', '')} {project.get('description', '')}")
+
+    desc = "یک پروژه نمونه برای تست فیلتر با توضیحات طولانی و جزئیات فنی " * 12
+    skill_sets = [("وردپرس", "Photoshop"), ("مدیریت پروژه", "Python"), ("سئو",),
+                  ("تولید محتوا", "اینستاگرام", "Django REST"), ("Excel", "گرافیک")]
+    pages = {
+        "skills": [{"id": i, "title": f"پروژه {i}", "description": desc, "past_time": "۲ ساعت پیش",
+                    "min_budget": 5_000_000,
+                    "skills": [{"name": n} for n in skill_sets[i % len(skill_sets)]]}
+                   for i in range(20)],
+        "description": [{"id": i, "title": f"پروژه {i}", "description": desc, "past_time": "۲ ساعت پیش",
+                         "min_budget": 5_000_000,
+                         "skills": []}
+                        for i in range(20)],
+    }
+
+    bot = Karlancer.__new__(Karlancer)
+    for label, page in pages.items():
+        print(f"📄 مسیر {label}:")
+        elapsed = {}
+        for name, fn in (("legacy", lambda p: legacy(bot, p)),
+                         ("compiled", lambda p: compiled(bot, p)),
+                         ("scored", bot._is_relevant)):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                kept = [p for p in page if fn(p)]
+            elapsed[name] = time.perf_counter() - start
+            print(f"  {name:9s} {elapsed[name] / rounds * 1000:8.3f} ms/صفحه "
+                  f"({len(page)} پروژه، {len(kept)} مرتبط)")
+        print(f"  ⚡ بهبود: {elapsed['legacy'] / max(elapsed['compiled'], 1e-9):.1f}x")
+
+
 # ---------------------------------------------------------------------------
 # Setup Telegram (جایگزین get_chat_id.py)
 # ---------------------------------------------------------------------------
@@ -1251,7 +3326,8 @@ def setup_telegram():
     input("⏸️  وقتی پیام رو فرستادی، Enter رو بزن...")
 
     try:
-        resp = requests.get(f"https://api.telegram.org/bot{bot_token}/getUpdates", timeout=10)
+        with STARTUP.phase("دریافت getUpdates تلگرام"):
+            resp = HTTP.get(f"https://api.telegram.org/bot{bot_token}/getUpdates", timeout=10)
         if resp.status_code != 200:
             print(f"❌ خطا: {resp.status_code}")
             sys.exit(1)
@@ -1266,8 +3342,9 @@ def setup_telegram():
         print(f"\n✅ Chat ID پیدا شد: {chat_id}")
         print(f"👤 نام: {chat.get('first_name', 'N/A')}")
 
-        with open('.telegram_chat_id', 'w') as f:
-            f.write(str(chat_id))
+        with STARTUP.phase("ذخیره .telegram_chat_id"):
+            with open('.telegram_chat_id', 'w') as f:
+                f.write(str(chat_id))
         print("💾 Chat ID در فایل .telegram_chat_id ذخیره شد")
 
     except Exception as e:
@@ -1279,6 +3356,42 @@ def setup_telegram():
 # Main
 # ---------------------------------------------------------------------------
 
+def start_background_checks(bot: Karlancer, tg: TelegramLogger = None):
+    # بررسی‌های اتصال همزمان با اولین چرخه اجرا میشن و فقط نتیجه رو گزارش می‌کنن
+    def check_telegram():
+        with STARTUP.phase("تست اتصال تلگرام"):
+            ok = tg.test_connection()
+        if ok:
+            bot.log_success("Telegram Logger فعال شد")
+        else:
+            tg.disable()
+            bot.log_warning("خطا در اتصال به تلگرام - ادامه بدون Telegram")
+        STARTUP.done("telegram")
+
+    def check_auth():
+        with STARTUP.phase("بررسی توکن کارلنسر"):
+            ok = bot.check_auth()
+        if not ok:
+            bot.log_error("توکن KARELANCER_BEARER نامعتبر یا منقضی شده است")
+            if tg:
+                tg.send_error("توکن KARELANCER_BEARER نامعتبر یا منقضی شده است")
+        STARTUP.done("auth")
+
+    def check_claude():
+        with STARTUP.phase("بررسی claude CLI"):
+            path = shutil.which('claude')
+        if not path:
+            bot.log_error("فایل اجرایی claude در PATH پیدا نشد — تحلیل و پاسخ چت کار نخواهد کرد")
+        STARTUP.done("claude")
+
+    checks = [check_auth, check_claude] + ([check_telegram] if tg else [])
+    STARTUP.require("auth", "claude", *(["telegram"] if tg else []))
+    pool = ThreadPoolExecutor(max_workers=len(checks), thread_name_prefix='startup')
+    for check in checks:
+        pool.submit(check)
+    pool.shutdown(wait=False)
+
+
 def main():
     parser = argparse.ArgumentParser(description='ربات خودکار کارلنسر')
     parser.add_argument('--interval', type=int, default=300,
@@ -1297,18 +3410,63 @@ def main():
                         help='بدون پروکسی (اتصال مستقیم)')
     parser.add_argument('--setup-telegram', action='store_true',
                         help='دریافت Chat ID تلگرام')
+    parser.add_argument('--fetch-workers', type=int, default=11,
+                        help='تعداد درخواست همزمان برای جستجوی پروژه‌ها (پیش‌فرض: 11)')
+    parser.add_argument('--search-mode', choices=Karlancer.SEARCH_MODES, default='queries',
+                        help='queries: کوئری‌های کلیدی | feed: فید جدیدترین‌ها + فیلتر محلی (پیش‌فرض: queries)')
+    parser.add_argument('--state-backend', choices=sorted(STATE_BACKENDS), default='sqlite',
+                        help='محل ذخیره وضعیت: sqlite (karlancer.db)، journal (state.journal) یا json (پیش‌فرض: sqlite)')
+    parser.add_argument('--stats', action='store_true',
+                        help='نمایش آمار ذخیره‌شده و خروج')
+    parser.add_argument('--bench-relevance', action='store_true',
+                        help='بنچمارک فیلتر مرتبط بودن (قدیمی در برابر کامپایل‌شده) و خروج')
+    parser.add_argument('--incremental', action='store_true',
+                        help='جستجوی افزایشی: توقف صفحه‌بندی در اولین پروژه‌ی دیده‌شده هر کوئری')
+    parser.add_argument('--analysis-workers', type=int, default=1,
+                        help='تعداد تحلیل همزمان Claude (پیش‌فرض: 1، حداکثر: 4)')
+    parser.add_argument('--bid-interval', type=int, default=900,
+                        help='فاصله بروزرسانی bidها بر حسب ثانیه (پیش‌فرض: 900)')
+    parser.add_argument('--stats-interval', type=int, default=1800,
+                        help='فاصله چاپ آمار و ذخیره وضعیت بر حسب ثانیه (پیش‌فرض: 1800)')
+    parser.add_argument('--chat-interval', type=int, default=15,
+                        help='فاصله بررسی چت‌ها وقتی مکالمه فعاله؛ در بیکاری تا --interval زیاد میشه (پیش‌فرض: 15)')
+    parser.add_argument('--chat-workers', type=int, default=3,
+                        help='تعداد اتاق‌هایی که همزمان پاسخشان تولید میشه (پیش‌فرض: 3)')
+    parser.add_argument('--claude-concurrency', type=int, default=3,
+                        help='حداکثر پردازش همزمان claude در کل برنامه (پیش‌فرض: 3)')
+    parser.add_argument('--claude-rpm', type=float, default=10,
+                        help='حداکثر فراخوانی Claude در دقیقه (پیش‌فرض: 10)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='کش تحلیل‌ها رو نادیده بگیر و دوباره تحلیل کن')
+    parser.add_argument('--startup-profile', action='store_true',
+                        help='زمان هر مرحله‌ی شروع برنامه رو چاپ کن')
     args = parser.parse_args()
+    STARTUP.enabled = args.startup_profile
+    STARTUP.require("loop")
 
-    if args.no_proxy:
-        for key in ('all_proxy', 'ALL_PROXY', 'http_proxy', 'HTTP_PROXY',
-                     'https_proxy', 'HTTPS_PROXY', 'ftp_proxy', 'FTP_PROXY'):
-            os.environ.pop(key, None)
-        print("🔌 پروکسی غیرفعال شد — اتصال مستقیم")
+    with STARTUP.phase("بارگذاری .env و پروکسی"):
+        load_env()
+        if args.no_proxy:
+            for key in ('all_proxy', 'ALL_PROXY', 'http_proxy', 'HTTP_PROXY',
+                         'https_proxy', 'HTTPS_PROXY', 'ftp_proxy', 'FTP_PROXY'):
+                os.environ.pop(key, None)
+            print("🔌 پروکسی غیرفعال شد — اتصال مستقیم")
 
     if args.setup_telegram:
         setup_telegram()
+        STARTUP.report()
+        return
+
+    if args.bench_relevance:
+        benchmark_relevance()
+        return
+
+    if args.stats:
+        print_state_stats(open_state_store(args.state_backend))
         return
 
+    CLAUDE.configure(args.claude_rpm, CLAUDE.burst, args.claude_concurrency)
+
     bearer = os.environ.get("KARELANCER_BEARER")
     if not bearer:
         print("❌ KARELANCER_BEARER در .env تنظیم نشده")
@@ -1316,24 +3474,19 @@ def main():
 
     # تلگرام
     tg = None
-    bot_token = os.environ.get("TELEGRAM_BOT_TOKEN", "")
-    chat_id = args.telegram_chat_id
-
-    if not chat_id and Path('.telegram_chat_id').exists():
-        try:
-            chat_id = Path('.telegram_chat_id').read_text().strip()
-            print(f"📱 Chat ID از فایل خوانده شد: {chat_id}")
-        except Exception:
-            pass
+    with STARTUP.phase("خواندن تنظیمات تلگرام"):
+        bot_token = os.environ.get("TELEGRAM_BOT_TOKEN", "")
+        chat_id = args.telegram_chat_id
+        if not chat_id and Path('.telegram_chat_id').exists():
+            try:
+                chat_id = Path('.telegram_chat_id').read_text().strip()
+                print(f"📱 Chat ID از فایل خوانده شد: {chat_id}")
+            except Exception:
+                pass
 
     if chat_id and bot_token:
         tg = TelegramLogger(bot_token, chat_id)
-        print("🧪 تست اتصال به تلگرام...")
-        if not tg.test_connection():
-            print("⚠️  خطا در اتصال - ادامه بدون Telegram")
-            tg = None
-        else:
-            print("✅ Telegram Logger فعال شد!")
+        print("🧪 تست اتصال به تلگرام در پس‌زمینه...")
     else:
         print("ℹ️  Telegram Logger غیرفعال (برای فعال‌سازی: python3 karlancer.py --setup-telegram)")
 
@@ -1341,13 +3494,26 @@ def main():
     if github_token:
         print("🐙 GitHub Token: فعال")
 
-    bot = Karlancer(bearer_token=bearer, check_interval=args.interval, model=args.model, tg=tg, github_token=github_token)
+    with STARTUP.phase("ساخت ربات و بارگذاری وضعیت"):
+        bot = Karlancer(bearer_token=bearer, check_interval=args.interval, model=args.model, tg=tg, github_token=github_token,
+                       fetch_workers=args.fetch_workers, analysis_workers=args.analysis_workers,
+                       use_cache=not args.no_cache, incremental=args.incremental,
+                       search_mode=args.search_mode, state_backend=args.state_backend,
+                       chat_workers=args.chat_workers, chat_interval=args.chat_interval,
+                       bid_interval=args.bid_interval, stats_interval=args.stats_interval)
 
-    if args.project:
-        bot.process_single_project(args.project)
-        return
+    start_background_checks(bot, tg)
+
+    try:
+        if args.project:
+            STARTUP.done("loop", "پردازش تکی پروژه")
+            bot.process_single_project(args.project)
+            return
 
-    bot.run(once=args.once, chat_only=args.chat_only)
+        bot.run(once=args.once, chat_only=args.chat_only)
+    finally:
+        if tg:
+            tg.close()
 
 
 if __name__ == "__main__":